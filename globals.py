@@ -21,7 +21,25 @@ APP_VERSION      = "0.1"
 CONFIG_FILES = ["config.ini", "~/.config/system-notifier/config.ini"]
 LOG_FILE = sys.stderr
 LOG_TAG_WIDTH = 10
+# number of records kept in the in-memory log ring buffer
+LOG_BUFFER_SIZE = 1000
+# number of records waiting for the log writer before the oldest are dropped
+LOG_QUEUE_SIZE = 10000
 DEFAULT_PLUGIN_LIST = "battery, volume_pactl, iwd"
+# plugins of a session agent: only session resources, the daemon watches the system bus
+AGENT_PLUGIN_LIST = "volume_pactl"
 
 ICON_CACHE_DIR = ".icon_cache"
-ICON_THEME_DIR = "/usr/share/icons/breeze"
\ No newline at end of file
+ICON_THEME_DIR = "/usr/share/icons/breeze"
+
+# socket of the multi-user daemon (see --daemon and --agent)
+DAEMON_SOCKET = "/run/system-notifier/daemon.sock"
+
+# socket the plugin events are published on, relative to $XDG_RUNTIME_DIR
+EVENT_SOCKET = "system-notifier/events.sock"
+# event socket of the multi-user daemon, next to DAEMON_SOCKET
+DAEMON_EVENT_SOCKET = "/run/system-notifier/events.sock"
+
+HISTORY_FILE = "~/.local/state/system-notifier/history"
+# number of notifications kept in the history file (256 bytes each)
+HISTORY_SIZE = 4096
\ No newline at end of file
@@ -5,6 +5,31 @@ SERVICE_NAME="system-notifier.service"
 SERVICE_FILE_PATH="$HOME/.config/systemd/user/$SERVICE_NAME"
 PROJECT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" &>/dev/null && pwd)"
 PYTHON_EXEC="$(which python3)"
+EXTRA_ARGS=""
+ON_DEMAND=0
+SERVICE_TYPE="simple"
+RESTART="always"
+# seconds without events before an on-demand service exits
+IDLE_EXIT=300
+# space-separated paths that start an on-demand service when they change
+ACTIVATION_PATHS="${ACTIVATION_PATHS:-}"
+PATH_UNIT_NAME="system-notifier.path"
+PATH_UNIT_FILE_PATH="$HOME/.config/systemd/user/$PATH_UNIT_NAME"
+
+# --- Options ---
+for arg in "$@"; do
+    case "$arg" in
+        # agents only load the session plugins ([main] agent_plugins, default: volume_pactl)
+        --agent) EXTRA_ARGS="$EXTRA_ARGS --agent" ;;
+        --on-demand)
+            ON_DEMAND=1
+            EXTRA_ARGS="$EXTRA_ARGS --idle-exit $IDLE_EXIT"
+            SERVICE_TYPE="notify"
+            RESTART="on-failure"
+            ;;
+        *) echo "[!] Unknown option: $arg" >&2; exit 1 ;;
+    esac
+done
 
 # --- Functions ---
 log() {
@@ -24,6 +49,20 @@ if [ -z "$PYTHON_EXEC" ]; then
     error "python3 not found. Please install python3 and make sure it's in your PATH."
 fi
 
+# An on-demand service is only started again by a path unit. Without one
+# (or with paths that never report changes) it stops for good after the first idle exit.
+if [ "$ON_DEMAND" = "1" ]; then
+    if [ -z "$ACTIVATION_PATHS" ]; then
+        error "--on-demand needs ACTIVATION_PATHS, nothing would start the service again after it exited."
+    fi
+    for path in $ACTIVATION_PATHS; do
+        case "$path" in
+            /sys/*|/proc/*) error "$path does not report changes (sysfs and procfs send no inotify events), it cannot start the service." ;;
+        esac
+    done
+    log "Note: events of D-Bus plugins (battery, iwd, bluetooth, ...) are lost while the service is not running."
+fi
+
 # Create systemd user directory if it doesn't exist
 log "Checking for systemd user directory..."
 mkdir -p "$HOME/.config/systemd/user"
@@ -36,8 +75,9 @@ Description=System Notifier
 After=graphical-session.target
 
 [Service]
-ExecStart=$PYTHON_EXEC $PROJECT_DIR/main.py
-Restart=always
+Type=$SERVICE_TYPE
+ExecStart=$PYTHON_EXEC $PROJECT_DIR/main.py$EXTRA_ARGS
+Restart=$RESTART
 RestartSec=5
 
 [Install]
@@ -46,6 +86,27 @@ EOL
 
 log "Service file created successfully."
 
+if [ "$ON_DEMAND" = "1" ]; then
+    log "Creating path unit at $PATH_UNIT_FILE_PATH..."
+    {
+        echo "[Unit]"
+        echo "Description=Start System Notifier on changes"
+        echo
+        echo "[Path]"
+        # PathModified also fires on writes to files that are kept open (log files),
+        # PathChanged only when the writer closes the file
+        for path in $ACTIVATION_PATHS; do
+            echo "PathModified=$path"
+        done
+        echo "Unit=$SERVICE_NAME"
+        echo
+        echo "[Install]"
+        echo "WantedBy=default.target"
+    } > "$PATH_UNIT_FILE_PATH"
+    systemctl --user daemon-reload
+    systemctl --user enable --now "$PATH_UNIT_NAME"
+fi
+
 # Reload systemd user daemon
 log "Reloading systemd user daemon..."
 systemctl --user daemon-reload
@@ -16,18 +16,29 @@
 # along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
+import signal
 import os # Added for path expansion
 import configparser
 import argparse
+import json
 from dbus.mainloop.glib import DBusGMainLoop
 import gi
 gi.require_version("Gtk", "3.0")
 gi.require_version("Notify", "0.7")
 from gi.repository import GLib, Notify
 
-from globals import APP_VERSION, PROG_NAME, CONFIG_FILES, LOG_FILE
-from utils.helper import log
-from utils.plugin_loader import PluginContext, load_plugins
+from globals import APP_VERSION, PROG_NAME, AGENT_PLUGIN_LIST, CONFIG_FILES, LOG_FILE, HISTORY_FILE, HISTORY_SIZE, DAEMON_SOCKET, EVENT_SOCKET, DAEMON_EVENT_SOCKET
+from utils.helper import log, dump_log_buffer, flush_log, parse_log_level, set_log_level, set_buffer_level, memory_usage, process_age
+from utils.plugin_loader import PluginContext, load_plugins, stop_plugins, set_notification_server
+from utils.recorder import recorder, replay
+from utils import async_loop, offload, events, power
+from utils.history import history, parse_time
+from utils.ipc import Server
+from utils.multiuser import Agent
+from utils.icon_loader import save_icon_index
+from utils.systemd import sd_notify, listen_fds
+from utils.activity import IdleMonitor
+from utils.memory_report import MemoryReporter
 
 
 def init_argparse():
@@ -39,6 +50,25 @@ def init_argparse():
     )
     parser.add_argument("--config", "-c", type=str, default=None, help="specify a config file")
     parser.add_argument("--plugins", "-p", type=str, default="", help="give a list of plugins to load. If set the enabled_plugins option in the config file will be ignored.")
+    trace_group = parser.add_mutually_exclusive_group()
+    trace_group.add_argument("--record", type=str, default=None, metavar="FILE", help="record all events delivered to the plugins to FILE")
+    trace_group.add_argument("--replay", type=str, default=None, metavar="FILE", help="replay the events recorded in FILE and exit")
+    parser.add_argument("--speed", type=float, default=1.0, metavar="N", help="replay speed factor, 0 replays without delays (default: 1)")
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument("--daemon", action="store_true", help="run as system daemon and send the notifications to the session agents")
+    mode_group.add_argument("--agent", action="store_true", help="show the notifications of the system daemon in this session")
+    parser.add_argument("--memory-report", type=int, nargs="?", const=600, default=None, metavar="SECONDS",
+                        help="trace the memory allocated by the plugins and log a report every SECONDS (default: 600)")
+    parser.add_argument("--idle-exit", type=int, default=None, metavar="SECONDS", help="exit after SECONDS without events (for on-demand activation by systemd)")
+
+    subparsers = parser.add_subparsers(dest="command", title="commands")
+    history_parser = subparsers.add_parser("history", help="show the notification history")
+    history_parser.add_argument("--plugin", type=str, default=None, help="only show notifications of this plugin")
+    history_parser.add_argument("--since", type=str, default=None, help="start time, e.g. '2024-05-01 12:00' or '2h' (2 hours ago)")
+    history_parser.add_argument("--until", type=str, default=None, help="end time, same format as --since")
+    events_parser = subparsers.add_parser("events", help="print the events published by a running instance")
+    events_parser.add_argument("--socket", type=str, default=None, help="the event socket to read, e.g. the one of the system daemon")
+    events_parser.add_argument("--event", type=str, default="", help="a comma-separated list of events to show, e.g. 'battery,volume'")
     return parser
 
 def load_config(config_file: str):
@@ -61,6 +91,105 @@ def load_config(config_file: str):
         log(f"Config loaded from: {", ".join(loaded_files)}")
     return config
 
+def get_history_file(config):
+    return os.path.expanduser(config.get("main", "history_file", fallback=HISTORY_FILE))
+
+def show_history(config, args):
+    """Print the notifications in the history file matching the filters."""
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+    except ValueError as e:
+        log(f"Invalid time: {e}")
+        sys.exit(1)
+    try:
+        history.open(get_history_file(config), readonly=True)
+    except (OSError, ValueError) as e:
+        log(f"Cannot open history: {e}")
+        sys.exit(1)
+    try:
+        for entry in history.query(plugin=args.plugin, since=since, until=until):
+            print(entry)
+    finally:
+        history.close()
+
+def show_events(config, args):
+    """Print the published events as JSON lines until the notifier exits."""
+    path = events.get_event_socket(args.socket or config.get("main", "event_socket", fallback=EVENT_SOCKET))
+    wanted = {e.strip() for e in args.event.split(",") if e.strip()}
+    try:
+        for event in events.subscribe(path):
+            if not wanted or event.get("event") in wanted:
+                print(json.dumps(event), flush=True)
+    except OSError as e:
+        log(f"Cannot read events from {path}: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+def start_event_socket(config, daemon: bool):
+    """Publish the plugin events on the event socket, if enabled."""
+    # a system daemon has no (persistent) runtime dir, its socket is next to the daemon socket
+    event_socket = config.get("main", "event_socket", fallback=DAEMON_EVENT_SOCKET if daemon else EVENT_SOCKET)
+    if not event_socket:
+        return
+    path = events.get_event_socket(event_socket)
+    try:
+        # the events of the system daemon are for every user
+        events.start(path, mode=0o666 if daemon else 0o600)
+        log(f"Publishing events on {path}")
+    except OSError as e:
+        log(f"Cannot create event socket {path}: {e}")
+
+def open_history(config):
+    """Open the history file notifications are recorded to."""
+    size = config.getint("main", "history_size", fallback=HISTORY_SIZE)
+    if size <= 0:
+        return
+    try:
+        history.open(get_history_file(config), size)
+    except (OSError, ValueError) as e:
+        log(f"Cannot open history: {e}")
+
+def setup_logging(config):
+    """Apply the log levels from the config file."""
+    try:
+        set_log_level(parse_log_level(config.get("main", "log_level", fallback="info")))
+        set_buffer_level(parse_log_level(config.get("main", "log_buffer_level", fallback="debug")))
+    except ValueError as e:
+        log(str(e))
+
+def on_sigusr1():
+    """Dump the log ring buffer and the wakeup statistics on SIGUSR1."""
+    power.report()
+    dump_log_buffer()
+    return GLib.SOURCE_CONTINUE
+
+def on_sigusr2(memory_reporter):
+    """Start tracing memory on the first SIGUSR2, log a memory report on the following."""
+    memory_reporter.trigger()
+    return GLib.SOURCE_CONTINUE
+
+def on_sigterm(loop):
+    log("Terminated.")
+    loop.quit()
+    return GLib.SOURCE_REMOVE
+
+def on_idle(loop, timeout):
+    """Exit after timeout seconds without events."""
+    log(f"No events for {timeout}s, exiting. RSS: {memory_usage()} KiB, "
+        f"running for {process_age():.0f}s")
+    loop.quit()
+
+def report_ready():
+    """Tell systemd (Type=notify) that we are ready and log the startup cost."""
+    try:
+        startup, rss = process_age(), memory_usage()
+    except OSError:
+        startup, rss = 0.0, 0
+    sd_notify(f"READY=1\nSTATUS=Ready after {startup * 1000:.0f}ms, RSS {rss} KiB")
+    log(f"Ready after {startup * 1000:.0f}ms, RSS: {rss} KiB")
+
 def main():
     """Global entry point"""
     # command line argumnts
@@ -69,29 +198,125 @@ def main():
 
     # load config
     config = load_config(args.config)
+    setup_logging(config)
+
+    if args.command == "history":
+        show_history(config, args)
+        return
+    if args.command == "events":
+        show_events(config, args)
+        return
 
     # GLib Main Loop
     DBusGMainLoop(set_as_default=True)
 
-    # init libnotify
-    Notify.init(PROG_NAME)
+    # run asyncio on top of the GLib main context
+    async_loop.setup()
+    offload.configure(config.getint("main", "offload_workers", fallback=offload.MAX_WORKERS))
+    power.configure(config.getfloat("main", "battery_factor", fallback=power.BATTERY_FACTOR))
+
+    socket_path = config.get("main", "daemon_socket", fallback=DAEMON_SOCKET)
+    server = None
+    if args.daemon:
+        # the agents show the notifications, no session is needed here
+        try:
+            # the socket may be passed by systemd socket activation
+            fds = listen_fds()
+            # a new agent first gets the current state, like an event subscriber
+            server = Server(socket_path, mode=0o666, fd=fds[0] if fds else None,
+                            on_connect=events.send_last_events)
+        except OSError as e:
+            log(f"Cannot create daemon socket {socket_path}: {e}")
+            sys.exit(1)
+        set_notification_server(server)
+        events.set_relay(server)
+        log(f"Daemon listening on {socket_path}")
+    else:
+        # don't mix replayed notifications into the history
+        if not args.replay:
+            open_history(config)
+
+        # init libnotify
+        Notify.init(PROG_NAME)
+
+    if args.memory_report is not None:
+        # trace from the start, so the plugin initialisation is included
+        MemoryReporter.start_tracing()
+
+    # replayed events are not published, they are not the current state
+    if not args.replay:
+        start_event_socket(config, args.daemon)
+
+    # start before the plugins are loaded, they offload calls when they start
+    if args.replay:
+        try:
+            recorder.start_replay(args.replay)
+        except (OSError, ValueError) as e:
+            log(f"Cannot read trace {args.replay}: {e}")
+            sys.exit(1)
+    elif args.record:
+        recorder.open(args.record)
 
     # available_plugin_files = [f for f in os.listdir(plugin_dir) if f.endswith(".py") and not f.startswith("__")]
-    loaded_plugins = load_plugins(config, plugin_list=args.plugins)
+    plugin_list = args.plugins
+    if args.agent and not plugin_list:
+        # enabled_plugins is meant for the daemon or a standalone instance,
+        # loading the system bus plugins again would duplicate their notifications
+        plugin_list = config.get("main", "agent_plugins", fallback=AGENT_PLUGIN_LIST)
+    if args.agent and not plugin_list.strip():
+        loaded_plugins = {}
+    else:
+        loaded_plugins = load_plugins(config, plugin_list=plugin_list)
 
-    if not loaded_plugins:
+    agent = None
+    if args.agent:
+        agent = Agent(config, socket_path)
+    elif not loaded_plugins:
         log("No plugins loaded. Exiting.")
         return
 
-    log("Listen for system events... (Cancel with Ctrl+C)")
+    memory_reporter = MemoryReporter(loaded_plugins)
+    if args.memory_report is not None:
+        memory_reporter.start(args.memory_report)
+
     loop = GLib.MainLoop()
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, on_sigusr1)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, on_sigusr2, memory_reporter)
+    # stop cleanly when systemd stops the service, so the caches are saved
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, on_sigterm, loop)
+    if args.replay:
+        replay(args.replay, loaded_plugins, speed=args.speed, on_finished=loop.quit)
+    else:
+        idle_exit = args.idle_exit if args.idle_exit is not None else config.getint("main", "idle_exit", fallback=0)
+        if idle_exit > 0:
+            IdleMonitor(idle_exit, lambda: on_idle(loop, idle_exit),
+                        busy=lambda: bool(server and server.clients) or events.subscriber_count() > 0)
+        # write the icon index now, a later restart starts without searching the theme
+        save_icon_index()
+        report_ready()
+        log("Listen for system events... (Cancel with Ctrl+C)")
     try:
         loop.run()
     except KeyboardInterrupt:
+        flush_log()
         print(file=LOG_FILE)
         log("Goodby =)")
     finally:
-        Notify.uninit()
+        sd_notify("STOPPING=1")
+        stop_plugins(loaded_plugins)
+        save_icon_index()
+        power.report()
+        offload.shutdown()
+        events.stop()
+        recorder.close()
+        history.close()
+        if agent:
+            agent.close()
+        if server:
+            server.close()
+        else:
+            Notify.uninit()
+        flush_log()
 
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@
 # along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
 
 from main import PluginContext
+from utils import power
 import pydbus
 
 # fallback configuration
@@ -37,6 +38,8 @@ DEVICE_TYPE_LINE_POWER = 1
 DEVICE_TYPE_BATTERY    = 2
 WARNING_LEVEL_LOW      = 3
 WARNING_LEVEL_CRITICAL = 4
+# UPower State enum, as published in the battery events
+BATTERY_STATES = {1: "charging", 2: "discharging", 3: "empty", 4: "full", 5: "pending-charge", 6: "pending-discharge"}
 
 
 class Plugin:
@@ -59,6 +62,9 @@ class Plugin:
             "critical": self.ctx.get_icon("critical_icon", fallback=CRITICAL_ICON),
         }
 
+        # the state published in the battery events
+        self.battery = {"percentage": None, "state": "unknown", "warning_level": None}
+
         self.find_devices_and_setup_signals()
 
     def find_devices_and_setup_signals(self):
@@ -74,10 +80,15 @@ class Plugin:
 
                 if device_type == DEVICE_TYPE_LINE_POWER: # Line Power
                     self.ctx.log(f"Power device found: {device_path}")
-                    device.onPropertiesChanged = self.handle_line_power_change
+                    device.onPropertiesChanged = self.ctx.handler(self.handle_line_power_change)
+                    online = bool(device.Online)
+                    power.set_on_battery(not online)
+                    self.ctx.publish("power", online=online)
                 elif device_type == DEVICE_TYPE_BATTERY: # Battery
                     self.ctx.log(f"Battery found: {device_path}")
-                    device.onPropertiesChanged = self.handle_battery_change
+                    device.onPropertiesChanged = self.ctx.handler(self.handle_battery_change)
+                    self.update_battery({"Percentage": device.Percentage, "State": device.State,
+                                         "WarningLevel": device.WarningLevel})
 
         except Exception as e:
             self.ctx.log(f"Connection to UPower failed: {e}")
@@ -85,6 +96,8 @@ class Plugin:
     def handle_line_power_change(self, interface_name, changed_properties, invalidated_properties):
         """Handle power supply signals."""
         if 'Online' in changed_properties:
+            power.set_on_battery(not changed_properties['Online'])
+            self.ctx.publish("power", online=bool(changed_properties['Online']))
             if changed_properties['Online']:
                 self.ctx.notify(self.messages["on"],
                                 icon=self.icons["on"],
@@ -96,6 +109,7 @@ class Plugin:
 
     def handle_battery_change(self, interface_name, changed_properties, invalidated_properties):
         """Handle battery signals."""
+        self.update_battery(changed_properties)
         if 'WarningLevel' in changed_properties:
             level = changed_properties['WarningLevel']
             # UPower WarningLevel enum: 0-2=OK, 3=Low, 4=Critical
@@ -108,4 +122,17 @@ class Plugin:
                 self.ctx.notify(self.messages["critical"],
                                 icon=self.icons["critical"],
                                 urgency="critical",
-                                replace_id=NOTFICATION_ID)
\ No newline at end of file
+                                replace_id=NOTFICATION_ID)
+
+    def update_battery(self, properties: dict):
+        """Publish a battery event if one of the published properties changed."""
+        battery = dict(self.battery)
+        if "Percentage" in properties:
+            battery["percentage"] = round(properties["Percentage"], 1)
+        if "State" in properties:
+            battery["state"] = BATTERY_STATES.get(properties["State"], "unknown")
+        if "WarningLevel" in properties:
+            battery["warning_level"] = properties["WarningLevel"]
+        if battery != self.battery:
+            self.battery = battery
+            self.ctx.publish("battery", **battery)
@@ -0,0 +1,150 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Plugin to show notifications when Bluetooth devices connect or disconnect.
+
+Instead of one proxy and subscription per device, the plugin takes one
+GetManagedObjects snapshot from BlueZ and keeps a local mirror of all devices
+up to date with the ObjectManager signals and the PropertiesChanged signals of
+the Device1 interface. The cost does not depend on the number of paired
+devices.
+"""
+
+from main import PluginContext
+from utils.helper import DEBUG
+import pydbus
+
+# fallback configuration
+CONNECTED_MESSAGE = "Bluetooth device connected"
+DISCONNECTED_MESSAGE = "Bluetooth device disconnected"
+CONNECTED_ICON = "bluetooth-active"
+DISCONNECTED_ICON = "bluetooth-disabled"
+
+# D-Bus constants
+BLUEZ_BUS_NAME = "org.bluez"
+DEVICE_INTERFACE = "org.bluez.Device1"
+OBJ_MANAGER_INTERFACE = "org.freedesktop.DBus.ObjectManager"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+# device properties the plugin uses, others (e.g. the RSSI during discovery) are ignored
+DEVICE_PROPERTIES = ("Connected", "Alias", "Name")
+
+# notification id for notification replacement
+NOTIFICATION_ID = "bluetooth_notification_"
+
+
+class Plugin:
+    def __init__(self, ctx: PluginContext):
+        self.ctx = ctx
+        self.bus = pydbus.SystemBus()
+        # object path -> {"name": ..., "connected": ...}
+        self.devices = {}
+
+        self.connected_message = self.ctx.get_config("connected_message", fallback=CONNECTED_MESSAGE)
+        self.disconnected_message = self.ctx.get_config("disconnected_message", fallback=DISCONNECTED_MESSAGE)
+        self.connected_icon = self.ctx.get_icon("connected_icon", fallback=CONNECTED_ICON)
+        self.disconnected_icon = self.ctx.get_icon("disconnected_icon", fallback=DISCONNECTED_ICON)
+
+        self.on_bluez_signal = self.ctx.handler(self.handle_bluez_signal)
+        try:
+            # the bus daemon only sends the signals the mirror needs
+            for signal in ("InterfacesAdded", "InterfacesRemoved"):
+                self.bus.subscribe(sender=BLUEZ_BUS_NAME, iface=OBJ_MANAGER_INTERFACE, signal=signal,
+                                   signal_fired=self.on_bluez_signal)
+            self.bus.subscribe(sender=BLUEZ_BUS_NAME, iface=PROPERTIES_INTERFACE, signal="PropertiesChanged",
+                               arg0=DEVICE_INTERFACE, signal_fired=self.filter_device_changed)
+            # reload the snapshot when bluetoothd is (re)started
+            self.bus.subscribe(sender="org.freedesktop.DBus", signal="NameOwnerChanged", arg0=BLUEZ_BUS_NAME,
+                               signal_fired=self.ctx.handler(self.handle_name_owner_changed))
+        except Exception as e:
+            self.ctx.log(f"Error subscribing to BlueZ signals: {e}")
+            return
+        self.load_devices()
+
+    def load_devices(self):
+        """Fill the device mirror from a single GetManagedObjects call, made in the offload pool."""
+        self.ctx.offload(self.get_managed_objects, on_done=self.set_devices,
+                         on_error=lambda e: self.ctx.log(f"Connection to BlueZ failed: {e}"))
+
+    def get_managed_objects(self):
+        obj_manager = self.bus.get(BLUEZ_BUS_NAME, "/")[OBJ_MANAGER_INTERFACE]
+        return obj_manager.GetManagedObjects()
+
+    def set_devices(self, managed_objects: dict):
+        self.devices.clear()
+        for path, interfaces in managed_objects.items():
+            if DEVICE_INTERFACE in interfaces:
+                self.add_device(path, interfaces[DEVICE_INTERFACE])
+        self.ctx.log(f"{len(self.devices)} Bluetooth devices found.")
+
+    def add_device(self, path: str, properties: dict):
+        self.devices[path] = {
+            "name": self.device_name(properties, path),
+            "connected": bool(properties.get("Connected", False)),
+        }
+
+    @staticmethod
+    def device_name(properties: dict, fallback: str):
+        return properties.get("Alias") or properties.get("Name") or properties.get("Address") or fallback
+
+    def handle_name_owner_changed(self, sender, object_path, iface, signal, params):
+        name, old_owner, new_owner = params
+        if new_owner:
+            self.ctx.log("BlueZ started, reloading devices.", level=DEBUG)
+            self.load_devices()
+        else:
+            self.devices.clear()
+
+    def filter_device_changed(self, sender, object_path, iface, signal, params):
+        """Drop the frequent changes of unused properties before the handler
+        wrapper, so they don't count as wakeups or activity."""
+        if any(name in params[1] for name in DEVICE_PROPERTIES):
+            self.on_bluez_signal(sender, object_path, iface, signal, params)
+
+    def handle_bluez_signal(self, sender, object_path, iface, signal, params):
+        """Dispatch the signals of org.bluez."""
+        if signal == "PropertiesChanged":
+            interface_name, changed_properties, invalidated_properties = params
+            if interface_name == DEVICE_INTERFACE:
+                self.handle_device_changed(object_path, changed_properties)
+        elif signal == "InterfacesAdded":
+            path, interfaces = params
+            if DEVICE_INTERFACE in interfaces:
+                self.add_device(path, interfaces[DEVICE_INTERFACE])
+        elif signal == "InterfacesRemoved":
+            path, interfaces = params
+            if DEVICE_INTERFACE in interfaces:
+                self.devices.pop(path, None)
+
+    def handle_device_changed(self, path: str, changed_properties: dict):
+        device = self.devices.get(path)
+        if device is None:
+            # should not happen, InterfacesAdded comes first
+            device = self.devices[path] = {"name": path.rsplit("/", 1)[-1], "connected": False}
+        if "Alias" in changed_properties or "Name" in changed_properties:
+            device["name"] = self.device_name(changed_properties, device["name"])
+        if "Connected" not in changed_properties:
+            return
+
+        connected = bool(changed_properties["Connected"])
+        if connected == device["connected"]:
+            return
+        device["connected"] = connected
+        self.ctx.log("%s connected: %s", device["name"], connected, level=DEBUG)
+        self.ctx.publish("bluetooth", source=path, name=device["name"], connected=connected)
+        message = self.connected_message if connected else self.disconnected_message
+        self.ctx.notify(message.format(name=device["name"]), device["name"],
+                        icon=self.connected_icon if connected else self.disconnected_icon,
+                        replace_id=NOTIFICATION_ID + path)
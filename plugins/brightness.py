@@ -17,6 +17,7 @@
 
 import os
 from main import PluginContext
+from utils.helper import DEBUG, ERROR
 import pydbus
 
 # fallback configuration
@@ -32,42 +33,61 @@ class Plugin:
         self.mid_icon = self.ctx.get_icon("medium_icon", fallback=BRIGHTNESS_MEDIUM_ICON)
         self.low_icon = self.ctx.get_icon("low_icon", fallback=BRIGHTNESS_LOW_ICON)
 
+        self.on_brightness_changed = self.ctx.handler(self.on_properties_changed)
         try:
             pydbus.SystemBus().subscribe(
                 iface="org.freedesktop.DBus.Properties",
                 signal="PropertiesChanged",
-                signal_fired=self.on_properties_changed
+                signal_fired=self.filter_properties_changed
             )
             self.ctx.log("Subscribed to D-Bus brightness events.")
         except Exception as e:
             self.ctx.log(f"Error subscribing to D-Bus brightness events: {e}")
 
+    def filter_properties_changed(self, sender, object_path, iface, signal, params):
+        """
+        The sender of the backlight signals differs between systems, so every
+        PropertiesChanged on the system bus arrives here. Only backlight
+        changes are passed to the handler, the others must not count as
+        wakeups or activity, nor be recorded.
+        """
+        if "backlight" in object_path and "SysFSPath" in params[1]:
+            self.on_brightness_changed(sender, object_path, iface, signal, params)
+
     def on_properties_changed(self, sender, object_path, iface, signal, params):
         interface_name, changed_properties, invalidated_properties = params
-        if "backlight" in object_path and "SysFSPath" in changed_properties:
-            self.ctx.log("Brightness change event detected.")
-            self.update_brightness_notification(sysfs_path=changed_properties["SysFSPath"])
+        self.ctx.log("Brightness change event detected.", level=DEBUG)
+        self.update_brightness_notification(sysfs_path=changed_properties["SysFSPath"])
 
     def update_brightness_notification(self, sysfs_path=None):
-        try:
-            if sysfs_path is None:
-                # Find the backlight device if not provided
-                for device in os.listdir("/sys/class/backlight/"):
-                    sysfs_path = os.path.join("/sys/class/backlight", device)
-                    break
-            
-            if sysfs_path:
-                with open(os.path.join(sysfs_path, "actual_brightness")) as f:
-                    brightness = int(f.read())
-                with open(os.path.join(sysfs_path, "max_brightness")) as f:
-                    max_brightness = int(f.read())
-                
-                brightness_percent = int((brightness / max_brightness) * 100)
+        # sysfs reads can stall while the backlight driver is busy, so they are offloaded
+        self.ctx.offload(self.read_brightness, sysfs_path,
+                         on_done=self.show_brightness, on_error=self.on_brightness_error)
 
-                icon = self.high_icon if brightness_percent >= 75 else self.mid_icon if brightness_percent >= 35 else self.low_icon
-                self.ctx.notify(f"Brightness: {brightness_percent}%", "", icon=icon, replace_id=NOTIFICATION_ID, progress=brightness_percent)
-            else:
-                self.ctx.log("No backlight device found.")
+    @staticmethod
+    def read_brightness(sysfs_path=None):
+        """Read the brightness in percent (blocking). Returns None if there is no backlight device."""
+        if sysfs_path is None:
+            # Find the backlight device if not provided
+            for device in os.listdir("/sys/class/backlight/"):
+                sysfs_path = os.path.join("/sys/class/backlight", device)
+                break
+        if not sysfs_path:
+            return None
 
-        except Exception as e:
-            self.ctx.log(f"Error updating brightness notification: {e}")
\ No newline at end of file
+        with open(os.path.join(sysfs_path, "actual_brightness")) as f:
+            brightness = int(f.read())
+        with open(os.path.join(sysfs_path, "max_brightness")) as f:
+            max_brightness = int(f.read())
+        return int((brightness / max_brightness) * 100)
+
+    def show_brightness(self, brightness_percent):
+        if brightness_percent is None:
+            self.ctx.log("No backlight device found.")
+            return
+        self.ctx.publish("brightness", brightness=brightness_percent)
+        icon = self.high_icon if brightness_percent >= 75 else self.mid_icon if brightness_percent >= 35 else self.low_icon
+        self.ctx.notify(f"Brightness: {brightness_percent}%", "", icon=icon, replace_id=NOTIFICATION_ID, progress=brightness_percent)
+
+    def on_brightness_error(self, e):
+        self.ctx.log("Error updating brightness notification: %s", e, level=ERROR)
\ No newline at end of file
@@ -24,6 +24,7 @@ demonstrate the various functions of the `ctx` object passed to the constructor.
 
 from gi.repository import GLib
 from main import PluginContext
+from utils import power
 import pydbus
 
 # Unique ID for replaceable notifications.
@@ -56,6 +57,10 @@ class Plugin:
         # --- 1. Logging ---
         # The log() method allows messages to be printed in the context of the plugin.
         # The tag (e.g., "[dummy]") is automatically prepended.
+        # An optional level (DEBUG, INFO, WARNING, ERROR from utils.helper) can
+        # be given, and the threshold can be set with 'log_level' in the
+        # plugin's config section. Arguments are only formatted if the message
+        # is written, e.g. self.ctx.log("Value: %s", value, level=DEBUG).
         self.ctx.log("Plugin is being initialized...")
 
         # --- 2. Reading Configuration ---
@@ -94,18 +99,21 @@ class Plugin:
         # --- 5. Updatable Notification ---
         # A notification with a 'replace_id' can be updated later.
         # Useful for things like volume or brightness changes.
+        # Timers are started with power.timeout_add_seconds(), which works like
+        # GLib.timeout_add_seconds() but runs less often on battery and
+        # counts the wakeups (see utils/power.py).
         self.ctx.log("Sending an updatable notification in 3 seconds...")
-        GLib.timeout_add_seconds(3, self.show_updatable_notification, info_icon)
+        power.timeout_add_seconds(3, self.show_updatable_notification, info_icon)
 
         # --- 6. Notification with Progress Bar ---
         self.ctx.log("Sending a notification with a progress bar...")
         self.progress_value = 0
         # We start the update loop for the progress bar
-        GLib.timeout_add_seconds(1, self.update_progress_notification)
+        power.timeout_add_seconds(1, self.update_progress_notification)
 
         # --- 7. Critical, Closable Notification ---
         self.ctx.log("Sending a critical notification that closes after 15s...")
-        GLib.timeout_add_seconds(10, self.show_and_close_notification, info_icon)
+        power.timeout_add_seconds(10, self.show_and_close_notification, info_icon)
 
         # --- 8. D-Bus Interaction ---
         # The PluginContext provides direct access to the system and session bus.
@@ -122,7 +130,7 @@ class Plugin:
             replace_id=REPLACEABLE_NOTIFICATION_ID
         )
         # Call the update method after 5 seconds
-        GLib.timeout_add_seconds(5, self.run_notification_update, icon)
+        power.timeout_add_seconds(5, self.run_notification_update, icon)
         return GLib.SOURCE_REMOVE # Stops the repetition of this timer
 
     def run_notification_update(self, icon: str) -> bool:
@@ -161,7 +169,7 @@ class Plugin:
             urgency="critical",
             replace_id=CLOSABLE_NOTIFICATION_ID
         )
-        GLib.timeout_add_seconds(5, self.close_notification)
+        power.timeout_add_seconds(5, self.close_notification)
         return GLib.SOURCE_REMOVE
 
     def close_notification(self) -> bool:
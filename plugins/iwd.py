@@ -16,6 +16,7 @@
 """Plugin to show network connection changes from iwd."""
 
 from main import PluginContext
+from utils.helper import DEBUG, ERROR
 import pydbus
 
 # D-Bus constants
@@ -31,12 +32,17 @@ class Plugin:
         self.ctx = context
         self.bus = pydbus.SystemBus()  # iwd is on the system bus
         self.subscriptions = {}
+        # object path -> number of the last state change, results of older
+        # (superseded) changes are dropped
+        self.generations = {}
         # --- Configuration ---
         self.connected_icon = self.ctx.get_icon("connected_icon", fallback="network-wireless-connected")
         self.disconnected_icon = self.ctx.get_icon("disconnected_icon", fallback="network-wireless-offline")
         self.connected_message = self.ctx.get_config("connected_message", fallback="Connected to {ssid}")
         self.disconnected_message = self.ctx.get_config("disconnected_message", fallback="Network disconnected")
 
+        self.on_station_properties_changed = self.ctx.handler(self.handle_station_properties_changed)
+
         self.ctx.log("Initializing iwd plugin...")
         self.setup_iwd_signals()
 
@@ -48,8 +54,8 @@ class Plugin:
             obj_manager = obj_manager_proxy[OBJ_MANAGER_INTERFACE]
 
             # Subscribe to signals for when network interfaces are added or removed
-            obj_manager.onInterfacesAdded = self.handle_interfaces_added
-            obj_manager.onInterfacesRemoved = self.handle_interfaces_removed
+            obj_manager.onInterfacesAdded = self.ctx.handler(self.handle_interfaces_added)
+            obj_manager.onInterfacesRemoved = self.ctx.handler(self.handle_interfaces_removed)
 
             # Process already existing stations
             managed_objects = obj_manager.GetManagedObjects()
@@ -73,7 +79,7 @@ class Plugin:
                 iface='org.freedesktop.DBus.Properties',
                 signal='PropertiesChanged',
                 object=path,
-                signal_fired=self.handle_station_properties_changed
+                signal_fired=self.on_station_properties_changed
             )
             self.subscriptions[path] = sub
             self.ctx.log(f"Listening for network changes on station: {path}")
@@ -98,8 +104,9 @@ class Plugin:
         if STATION_INTERFACE in interfaces:
             self.ctx.log(f"Station removed: {path}")
             self.remove_station_listener(path)
+            self.generations.pop(path, None)
 
-    def handle_station_properties_changed(self, sender, object_path, iface_name, signal_name, params):
+    async def handle_station_properties_changed(self, sender, object_path, iface_name, signal_name, params):
         """Callback for when a station's properties change. This handles connect/disconnect events."""
         interface_name, changed_properties, invalidated_properties = params
 
@@ -107,21 +114,36 @@ class Plugin:
             return
 
         state = changed_properties['State']
-        self.ctx.log(f"Station {object_path} state changed to: {state}")
+        generation = self.generations.get(object_path, 0) + 1
+        self.generations[object_path] = generation
+        self.ctx.log("Station %s state changed to: %s", object_path, state, level=DEBUG)
+        if state != 'connected':
+            self.ctx.publish("network", source=object_path, state=state, ssid=None)
 
         if state == 'connected':
             try:
-                station_proxy = self.bus.get(IWD_BUS_NAME, object_path)
-                network_path = station_proxy.ConnectedNetwork
+                # the D-Bus calls are run in worker threads, so the main loop
+                # keeps handling other events while we wait for iwd
+                network_path = await self.ctx.call_async(self.get_property, object_path, "ConnectedNetwork")
                 if network_path != '/':
-                    network_proxy = self.bus.get(IWD_BUS_NAME, network_path)
-                    ssid = network_proxy.Name
+                    ssid = await self.ctx.call_async(self.get_property, network_path, "Name")
+                    if self.generations.get(object_path) != generation:
+                        # the state changed again while we waited, don't show a stale network
+                        return
+                    self.ctx.publish("network", source=object_path, state=state, ssid=ssid)
                     summary = self.connected_message.format(ssid=ssid)
-                    self.ctx.notify(summary=summary, icon=self.connected_icon, replace_id=NOTIFICATION_ID)
+                    await self.ctx.notify_async(summary=summary, icon=self.connected_icon, replace_id=NOTIFICATION_ID)
             except Exception as e:
-                self.ctx.log(f"Error getting network details: {e}")
-                self.ctx.notify(summary=self.connected_message.format(ssid="network"), icon=self.connected_icon, replace_id=NOTIFICATION_ID)
+                self.ctx.log("Error getting network details: %s", e, level=ERROR)
+                if self.generations.get(object_path) != generation:
+                    return
+                self.ctx.publish("network", source=object_path, state=state, ssid=None)
+                await self.ctx.notify_async(summary=self.connected_message.format(ssid="network"), icon=self.connected_icon, replace_id=NOTIFICATION_ID)
 
         elif state == 'disconnected':
             summary = self.disconnected_message
-            self.ctx.notify(summary=summary, icon=self.disconnected_icon, replace_id=NOTIFICATION_ID)
\ No newline at end of file
+            await self.ctx.notify_async(summary=summary, icon=self.disconnected_icon, replace_id=NOTIFICATION_ID)
+
+    def get_property(self, object_path: str, name: str):
+        """Read a property of an iwd object (blocking)."""
+        return getattr(self.bus.get(IWD_BUS_NAME, object_path), name)
\ No newline at end of file
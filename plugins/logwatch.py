@@ -0,0 +1,340 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Plugin to show notifications for lines in log files matching a pattern.
+
+The files are watched with inotify and only the new bytes are read, in large
+chunks. All patterns are combined into a single regular expression, so every
+chunk is scanned once no matter how many patterns are configured.
+
+The offset and inode of every file are saved in a state file (shortly after
+a change and when the notifier exits), so no lines are missed (or reported
+twice) after a restart. Log rotation is detected through a watch on the
+parent directory.
+"""
+
+import json
+import os
+import re
+from gi.repository import GLib
+from main import PluginContext
+from utils.helper import DEBUG, ERROR
+from utils import power
+from utils.inotify import (Inotify, IN_MODIFY, IN_CREATE, IN_MOVED_TO,
+                           IN_MOVE_SELF, IN_DELETE_SELF, IN_Q_OVERFLOW)
+
+# fallback configuration
+ICON = "dialog-warning"
+STATE_FILE = "logwatch_state.json"
+
+NOTIFICATION_ID = "logwatch_notification_"
+PATTERN_PREFIX = "pattern_"
+
+CHUNK_SIZE = 1024 * 1024
+# incomplete lines longer than this are discarded
+MAX_LINE = 64 * 1024
+# seconds to wait before the state file is written after a change
+SAVE_DELAY = 10
+MAX_BODY = 200
+
+
+class WatchedFile:
+    """Read position of one log file."""
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.inode = None
+        self.dev = None
+        self.offset = 0
+        self.partial = b""
+        self.wd = None
+        # the error of the last open(), if it failed for another reason than a missing file
+        self.error = None
+        self.error_logged = False
+
+    def open(self):
+        """(Re)open the file. Returns False if the file does not exist or cannot be read."""
+        self.close()
+        self.error = None
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            # e.g. /var/log/auth.log is only readable by root and adm
+            self.error = e
+            return False
+        self.error_logged = False
+        st = os.fstat(self.fd)
+        self.inode, self.dev = st.st_ino, st.st_dev
+        self.offset = 0
+        self.partial = b""
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def is_rotated(self):
+        """Check whether the path now points to a different file."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_ino, st.st_dev) != (self.inode, self.dev)
+
+    def read_lines(self):
+        """Yield blocks of complete new lines."""
+        if self.fd is None:
+            return
+        if os.fstat(self.fd).st_size < self.offset:
+            # the file was truncated (copytruncate rotation)
+            self.offset = 0
+            self.partial = b""
+        while True:
+            data = os.pread(self.fd, CHUNK_SIZE, self.offset)
+            if not data:
+                break
+            self.offset += len(data)
+            at_end = len(data) < CHUNK_SIZE
+            data = self.partial + data
+            end = data.rfind(b"\n") + 1
+            self.partial = data[end:]
+            if len(self.partial) > MAX_LINE:
+                self.partial = b""
+            if end:
+                yield data[:end]
+            if at_end:
+                break
+
+    def state(self):
+        return {"inode": self.inode, "dev": self.dev, "offset": self.offset - len(self.partial)}
+
+
+class Plugin:
+    def __init__(self, ctx: PluginContext):
+        self.ctx = ctx
+        self.icon = self.ctx.get_icon("icon", fallback=ICON)
+        self.on_match = self.ctx.handler(self.handle_match)
+        self.state_file = self.ctx.get_config("state_file",
+                                              fallback=os.path.join(self.ctx.cache_dir, STATE_FILE))
+        self.save_timer = None
+        self.files = {}       # path -> WatchedFile
+        self.file_wds = {}    # watch descriptor -> WatchedFile
+        self.dir_wds = {}     # watch descriptor -> directory
+        self.messages = {}
+
+        self.matcher = self.compile_patterns()
+        if self.matcher is None:
+            self.ctx.log("No patterns configured. This plugin will not work.")
+            return
+
+        paths = [os.path.abspath(p.strip()) for p
+                 in self.ctx.get_config("files", fallback="").split(",") if p.strip()]
+        if not paths:
+            self.ctx.log("No files configured. This plugin will not work.")
+            return
+
+        try:
+            self.inotify = Inotify()
+        except OSError as e:
+            self.ctx.log(f"Cannot initialize inotify: {e}")
+            return
+
+        saved_state = self.load_state()
+        for path in paths:
+            self.add_file(path, saved_state.get(path))
+        GLib.io_add_watch(self.inotify.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self.on_inotify_event)
+        self.ctx.log(f"Watching {len(self.files)} files for {len(self.messages)} patterns")
+
+    def compile_patterns(self):
+        """Combine all pattern_<name> options into one regular expression."""
+        parts = []
+        if not self.ctx.config.has_section(self.ctx.plugin):
+            return None
+        # raw, so patterns may contain '%'
+        for option, pattern in self.ctx.config.items(self.ctx.plugin, raw=True):
+            if not option.startswith(PATTERN_PREFIX):
+                continue
+            # the name is used as a group name in the combined expression
+            name = re.sub(r"\W|^(?=\d)", "_", option[len(PATTERN_PREFIX):])
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                self.ctx.log(f"Invalid pattern {name}: {e}", level=ERROR)
+                continue
+            parts.append(f"(?P<{name}>{pattern})")
+            self.messages[name] = self.ctx.get_config(f"message_{name}", fallback=f"Log: {name}")
+        if not parts:
+            return None
+        return re.compile("|".join(parts).encode(), re.MULTILINE)
+
+    def add_file(self, path: str, state: dict = None):
+        """Start watching a file, resuming from the saved state if possible."""
+        watched = WatchedFile(path)
+        self.files[path] = watched
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            wd = self.inotify.add_watch(directory, IN_CREATE | IN_MOVED_TO)
+            self.dir_wds[wd] = directory
+        except OSError as e:
+            self.ctx.log(f"Cannot watch {directory}: {e}")
+        if not watched.open():
+            self.log_open_error(watched)
+            return
+        self.watch_file(watched)
+
+        size = os.fstat(watched.fd).st_size
+        if state and (state.get("inode"), state.get("dev")) == (watched.inode, watched.dev) \
+                and state.get("offset", 0) <= size:
+            # same file as before the restart, continue where we stopped
+            watched.offset = state["offset"]
+        elif state:
+            # rotated while we were not running, check the rest of the old file first
+            self.read_rotated_remainder(path, state)
+        else:
+            # first start, don't report old lines
+            watched.offset = size
+        self.read_file(watched)
+
+    def watch_file(self, watched: WatchedFile):
+        try:
+            watched.wd = self.inotify.add_watch(watched.path, IN_MODIFY | IN_MOVE_SELF | IN_DELETE_SELF)
+            self.file_wds[watched.wd] = watched
+        except OSError as e:
+            self.ctx.log(f"Cannot watch {watched.path}: {e}")
+
+    def read_rotated_remainder(self, path: str, state: dict):
+        """Read the unread end of a file that was rotated to path.1."""
+        old = WatchedFile(path + ".1")
+        if not old.open():
+            return
+        if (old.inode, old.dev) == (state.get("inode"), state.get("dev")):
+            old.offset = state.get("offset", 0)
+            self.process(old)
+        old.close()
+
+    def on_inotify_event(self, fd, condition):
+        changed = set()
+        for wd, mask, cookie, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.files.values())
+            elif wd in self.file_wds:
+                changed.add(self.file_wds[wd])
+            elif wd in self.dir_wds:
+                path = os.path.join(self.dir_wds[wd], name)
+                if path in self.files:
+                    self.handle_rotation(self.files[path])
+        for watched in changed:
+            self.read_file(watched)
+        return GLib.SOURCE_CONTINUE
+
+    def handle_rotation(self, watched: WatchedFile):
+        """The path was (re)created: finish the old file and switch to the new one."""
+        if watched.fd is not None and not watched.is_rotated():
+            return
+        self.ctx.log("%s was rotated", watched.path, level=DEBUG)
+        if watched.fd is not None:
+            self.process(watched)
+        if watched.wd is not None:
+            self.file_wds.pop(watched.wd, None)
+            self.inotify.rm_watch(watched.wd)
+            watched.wd = None
+        if watched.open():
+            self.watch_file(watched)
+            self.read_file(watched)
+        else:
+            self.log_open_error(watched)
+
+    def log_open_error(self, watched: WatchedFile):
+        """Log why a file cannot be read, unreadable files only once."""
+        if watched.error is None:
+            self.ctx.log(f"{watched.path} does not exist yet.")
+        elif not watched.error_logged:
+            watched.error_logged = True
+            self.ctx.log(f"Cannot read {watched.path}, skipping it: {watched.error}", level=ERROR)
+
+    def read_file(self, watched: WatchedFile):
+        try:
+            self.process(watched)
+        except OSError as e:
+            self.ctx.log(f"Error reading {watched.path}: {e}", level=ERROR)
+        self.schedule_save()
+
+    def process(self, watched: WatchedFile):
+        """Scan the new lines of a file and notify once per matching pattern."""
+        matches = {}
+        search = self.matcher.search
+        for block in watched.read_lines():
+            pos = 0
+            while True:
+                m = search(block, pos)
+                if m is None:
+                    break
+                line_start = block.rfind(b"\n", 0, m.start()) + 1
+                line_end = block.find(b"\n", m.end())
+                if line_end < 0:
+                    line_end = len(block)
+                count, _ = matches.get(m.lastgroup, (0, None))
+                matches[m.lastgroup] = (count + 1, block[line_start:line_end])
+                # report every line only once
+                pos = line_end + 1
+        for name, (count, line) in matches.items():
+            self.on_match(name, count, line.decode(errors="replace"))
+
+    def handle_match(self, name: str, count: int, line: str):
+        """Notify about the lines matching a pattern (the last line is shown)."""
+        body = line if len(line) <= MAX_BODY else line[:MAX_BODY] + "…"
+        if count > 1:
+            body = f"{body}\n(+{count - 1} more)"
+        self.ctx.notify(self.messages.get(name, name), body, icon=self.icon,
+                        urgency="critical", replace_id=NOTIFICATION_ID + name)
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.ctx.log(f"Cannot read state file: {e}")
+            return {}
+
+    def schedule_save(self):
+        """Write the state file after SAVE_DELAY seconds (bursts cause only one write)."""
+        if self.save_timer is None:
+            # the delay is longer on battery
+            self.save_timer = power.timeout_add_seconds(SAVE_DELAY, self.save_state)
+
+    def stop(self):
+        """Write a pending state before exiting, so processed lines are not reported again."""
+        if self.save_timer is not None:
+            GLib.source_remove(self.save_timer)
+            self.save_state()
+
+    def save_state(self):
+        self.save_timer = None
+        state = {path: w.state() for path, w in self.files.items() if w.fd is not None}
+        tmp_file = self.state_file + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            self.ctx.log(f"Cannot write state file: {e}")
+        return GLib.SOURCE_REMOVE
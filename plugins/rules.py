@@ -0,0 +1,89 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Plugin to send notifications for D-Bus property changes described by
+`[rule:<name>]` sections in the config file (see utils/rule_engine.py).
+
+All rules are compiled into dispatch tables when the plugin is loaded. There
+is one PropertiesChanged subscription per (bus, sender), and every signal is
+matched by a dictionary lookup on (path, interface) and the property name.
+"""
+
+from main import PluginContext
+from utils.helper import DEBUG, ERROR
+from utils.icon_loader import get_icon
+from utils.rule_engine import compile_rules
+import pydbus
+
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+
+class Plugin:
+    def __init__(self, ctx: PluginContext):
+        self.ctx = ctx
+        self.subscriptions = []
+        self.on_properties_changed = self.ctx.handler(self.handle_properties_changed)
+
+        self.tables, errors = compile_rules(self.ctx.config, self.resolve_icon)
+        for error in errors:
+            self.ctx.log("Invalid rule: %s", error, level=ERROR)
+        # the tables are addressed by a string key, so recorded events can be replayed
+        self.tables = {f"{bus} {sender}": table for (bus, sender), table in self.tables.items()}
+
+        buses = {}
+        for key, table in self.tables.items():
+            try:
+                if table.bus not in buses:
+                    buses[table.bus] = pydbus.SystemBus() if table.bus == "system" else pydbus.SessionBus()
+                self.subscribe(buses[table.bus], key, table)
+            except Exception as e:
+                self.ctx.log(f"Error subscribing to {table.sender}: {e}")
+
+        self.ctx.log(f"{sum(t.count for t in self.tables.values())} rules "
+                     f"with {len(self.subscriptions)} subscriptions loaded.")
+
+    def resolve_icon(self, icon_name: str):
+        """Resolve an icon name to a file once, when the rules are compiled."""
+        return get_icon(icon_name, self.ctx.theme_dir, self.ctx.cache_dir)
+
+    def subscribe(self, bus, key: str, table):
+        """Subscribe to PropertiesChanged of a sender, filtered by the bus as far as possible."""
+        paths = table.paths
+        interfaces = table.interfaces
+        sub = bus.subscribe(
+            sender=table.sender,
+            iface=PROPERTIES_INTERFACE,
+            signal="PropertiesChanged",
+            # let the bus daemon drop signals no rule is interested in
+            object=next(iter(paths)) if paths and len(paths) == 1 else None,
+            arg0=next(iter(interfaces)) if len(interfaces) == 1 else None,
+            signal_fired=lambda sender, path, iface, signal, params:
+                self.on_properties_changed(key, path, params)
+        )
+        self.subscriptions.append(sub)
+
+    def handle_properties_changed(self, key, object_path, params):
+        """Match a PropertiesChanged signal against the rules and notify."""
+        table = self.tables.get(key)
+        if table is None:
+            return
+        interface_name, changed_properties, invalidated_properties = params
+        for rule, value in table.match(object_path, interface_name, changed_properties):
+            self.ctx.log("Rule %s matched %s=%r", rule.name, rule.property, value, level=DEBUG)
+            try:
+                self.ctx.notify(**rule.render(value, object_path))
+            except Exception as e:
+                self.ctx.log("Error in rule %s: %s", rule.name, e, level=ERROR)
@@ -0,0 +1,275 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Plugin to warn about high temperatures, memory pressure, full disks and CPU
+throttling. None of them are announced via D-Bus, so they are polled.
+
+All values are read in one batch per tick from file descriptors that are kept
+open (pread at offset 0 returns the current value of a sysfs/procfs file).
+The interval between ticks adapts to the values: it is doubled (up to
+max_interval) while all values are stable and reset to min_interval when a
+value gets close to its threshold. Alerts use a hysteresis, so a value
+oscillating around a threshold does not cause a flood of notifications.
+"""
+
+from abc import ABC, abstractmethod
+import glob
+import os
+from gi.repository import GLib
+from main import PluginContext
+from utils.helper import DEBUG
+from utils import power
+
+# fallback configuration
+MIN_INTERVAL = 5
+MAX_INTERVAL = 300
+THERMAL_THRESHOLD = 90
+THERMAL_HYSTERESIS = 5
+MEMORY_THRESHOLD = 20
+MEMORY_HYSTERESIS = 5
+DISK_THRESHOLD = 90
+DISK_HYSTERESIS = 2
+DISK_MOUNTS = "/"
+THERMAL_ICON = "temperature-high"
+MEMORY_ICON = "dialog-warning"
+DISK_ICON = "drive-harddisk"
+THROTTLE_ICON = "temperature-high"
+
+# notification id prefix for notification replacement
+NOTIFICATION_ID = "sysmon_notification_"
+
+READ_SIZE = 4096
+
+
+class Probe(ABC):
+    """A value that is compared against a threshold."""
+    def __init__(self, name, summary, body, icon, threshold, hysteresis, near=None, urgency="critical"):
+        self.name = name
+        self.summary = summary
+        self.body = body
+        self.icon = icon
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        # distance to the threshold below which the fast polling interval is used
+        self.near = 2 * hysteresis if near is None else near
+        self.urgency = urgency
+        self.value = None
+        self.alert = False
+
+    @abstractmethod
+    def read(self):
+        """Return the current value or None if it cannot be read."""
+
+    def close(self):
+        pass
+
+    def update(self, value):
+        """
+        Store a new value. Returns 'alert' or 'clear' if the alert state
+        changed, 'near' if the value is close to the threshold, 'stable' if
+        it did not change much and None otherwise.
+        """
+        last, self.value = self.value, value
+        if not self.alert and value >= self.threshold:
+            self.alert = True
+            return "alert"
+        if self.alert and value < self.threshold - self.hysteresis:
+            self.alert = False
+            return "clear"
+        if self.alert or value >= self.threshold - self.near:
+            return "near"
+        if last is not None and abs(value - last) <= self.hysteresis / 2:
+            return "stable"
+        return None
+
+
+class FileProbe(Probe):
+    """Reads a value from a sysfs/procfs file through a persistent file descriptor."""
+    def __init__(self, path, parse, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.parse = parse
+        self.fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+
+    def read(self):
+        try:
+            return self.parse(os.pread(self.fd, READ_SIZE, 0))
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        os.close(self.fd)
+
+
+class CounterProbe(FileProbe):
+    """Reports how much a counter (e.g. throttle events) grew since the last read."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_count = None
+
+    def read(self):
+        count = super().read()
+        if count is None:
+            return None
+        last, self.last_count = self.last_count, count
+        return 0 if last is None else count - last
+
+
+class DiskProbe(Probe):
+    """Reports the used space of a mount point in percent."""
+    def __init__(self, mount, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mount = mount
+
+    def read(self):
+        try:
+            st = os.statvfs(self.mount)
+        except OSError:
+            return None
+        total = st.f_blocks - st.f_bfree + st.f_bavail
+        if total <= 0:
+            return None
+        return (st.f_blocks - st.f_bfree) * 100 / total
+
+
+def parse_millidegrees(data: bytes):
+    return int(data) / 1000
+
+def parse_pressure(data: bytes):
+    # some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    first_line = data.split(b"\n", 1)[0]
+    for field in first_line.split():
+        if field.startswith(b"avg10="):
+            return float(field[6:])
+    raise ValueError("no avg10 field")
+
+
+class Plugin:
+    def __init__(self, ctx: PluginContext):
+        self.ctx = ctx
+        self.min_interval = max(1, int(self.ctx.get_config("min_interval", fallback=MIN_INTERVAL)))
+        self.max_interval = max(self.min_interval, int(self.ctx.get_config("max_interval", fallback=MAX_INTERVAL)))
+        self.interval = self.min_interval
+        self.probes = []
+        self.timer = None
+
+        self.setup_thermal_probes()
+        self.setup_memory_probe()
+        self.setup_disk_probes()
+        self.setup_throttle_probe()
+
+        if not self.probes:
+            self.ctx.log("Nothing to monitor. This plugin will not work.")
+            return
+
+        self.ctx.log(f"Monitoring: {', '.join(p.name for p in self.probes)}")
+        power.add_listener(self.on_power_mode_changed)
+        self.tick()
+
+    def on_power_mode_changed(self, mode):
+        """Poll now and continue with the interval (or pause) of the new mode."""
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+        self.tick()
+
+    def config_float(self, option, fallback):
+        return float(self.ctx.get_config(option, fallback=fallback))
+
+    def add_probe(self, factory, *args, **kwargs):
+        try:
+            self.probes.append(factory(*args, **kwargs))
+        except OSError as e:
+            self.ctx.log(f"Cannot monitor {kwargs.get('name', args[0])}: {e}")
+
+    def setup_thermal_probes(self):
+        threshold = self.config_float("thermal_threshold", THERMAL_THRESHOLD)
+        hysteresis = self.config_float("thermal_hysteresis", THERMAL_HYSTERESIS)
+        icon = self.ctx.get_icon("thermal_icon", fallback=THERMAL_ICON)
+        for zone in sorted(glob.glob("/sys/class/thermal/thermal_zone*")):
+            try:
+                with open(os.path.join(zone, "type")) as f:
+                    zone_type = f.read().strip()
+            except OSError:
+                zone_type = os.path.basename(zone)
+            self.add_probe(FileProbe, os.path.join(zone, "temp"), parse_millidegrees,
+                           name=os.path.basename(zone), summary=f"High temperature ({zone_type})", body="{value:.0f} °C",
+                           icon=icon, threshold=threshold, hysteresis=hysteresis)
+
+    def setup_memory_probe(self):
+        if not os.path.exists("/proc/pressure/memory"):
+            return
+        self.add_probe(FileProbe, "/proc/pressure/memory", parse_pressure,
+                       name="memory pressure", summary="High memory pressure",
+                       body="Tasks stalled {value:.1f}% of the time",
+                       icon=self.ctx.get_icon("memory_icon", fallback=MEMORY_ICON),
+                       threshold=self.config_float("memory_threshold", MEMORY_THRESHOLD),
+                       hysteresis=self.config_float("memory_hysteresis", MEMORY_HYSTERESIS))
+
+    def setup_disk_probes(self):
+        threshold = self.config_float("disk_threshold", DISK_THRESHOLD)
+        hysteresis = self.config_float("disk_hysteresis", DISK_HYSTERESIS)
+        icon = self.ctx.get_icon("disk_icon", fallback=DISK_ICON)
+        mounts = self.ctx.get_config("disk_mounts", fallback=DISK_MOUNTS)
+        for mount in (m.strip() for m in mounts.split(",") if m.strip()):
+            self.add_probe(DiskProbe, mount, name=f"disk {mount}",
+                           summary=f"Disk {mount} is almost full", body="{value:.0f}% used", icon=icon,
+                           threshold=threshold, hysteresis=hysteresis, urgency="normal")
+
+    def setup_throttle_probe(self):
+        if self.ctx.get_config("throttle", fallback="yes").lower() not in ("yes", "true", "on", "1"):
+            return
+        # the package counter is the same for all cores of a package
+        paths = sorted(glob.glob("/sys/devices/system/cpu/cpu*/thermal_throttle/package_throttle_count"))
+        if paths:
+            self.add_probe(CounterProbe, paths[0], int, name="cpu throttling",
+                           summary="CPU is throttled", body="{value:.0f} throttle events",
+                           icon=self.ctx.get_icon("throttle_icon", fallback=THROTTLE_ICON),
+                           threshold=1, hysteresis=0.5, near=0, urgency="normal")
+
+    def tick(self):
+        """Read all probes, send or close notifications and schedule the next tick."""
+        self.timer = None
+        all_stable = True
+        any_near = False
+        for probe in self.probes:
+            value = probe.read()
+            if value is None:
+                continue
+            result = probe.update(value)
+            if result == "alert":
+                self.ctx.notify(probe.summary, probe.body.format(value=value), icon=probe.icon,
+                                urgency=probe.urgency, replace_id=NOTIFICATION_ID + probe.name)
+            elif result == "clear":
+                self.ctx.close_notification(NOTIFICATION_ID + probe.name)
+            any_near = any_near or result in ("alert", "near")
+            all_stable = all_stable and result in ("stable", "clear")
+
+        if any_near:
+            interval = self.min_interval
+        elif all_stable:
+            interval = min(self.interval * 2, self.max_interval)
+        else:
+            interval = max(self.interval // 2, self.min_interval)
+        if interval != self.interval:
+            self.ctx.log("Polling interval: %ds", interval, level=DEBUG)
+        self.interval = interval
+        if self.ctx.low_priority and power.on_battery():
+            self.ctx.log("Paused while on battery", level=DEBUG)
+            return GLib.SOURCE_REMOVE
+        # timeout_add_seconds lets GLib coalesce our wakeups with other timers,
+        # on battery the interval is scaled
+        self.timer = power.timeout_add_seconds(self.interval, self.tick)
+        return GLib.SOURCE_REMOVE
@@ -25,6 +25,7 @@ import subprocess
 import os
 from gi.repository import GLib
 from main import PluginContext
+from utils.helper import DEBUG, ERROR
 
 # fallback configuration
 VOLUME_HIGH_ICON = "audio-volume-high"
@@ -45,8 +46,17 @@ class Plugin:
         self.low_icon = self.ctx.get_icon("low_icon", fallback=VOLUME_LOW_ICON)
         self.muted_icon = self.ctx.get_icon("muted_icon", fallback=VOLUME_MUTED_ICON)
         self.last_volume = 0
+        self.on_pactl_line = self.ctx.handler(self.handle_pactl_line)
+        self.default_sink_idx = None
+        # the running volume query, see update_volume_notification()
+        self.volume_query = None
 
-        self.default_sink_idx = self.get_default_sink_index()
+        # pactl is run in the offload pool, the main loop is never blocked by it
+        self.ctx.offload(self.get_default_sink_index, on_done=self.subscribe)
+
+    def subscribe(self, default_sink_idx):
+        """Start watching pactl events once the default sink is known."""
+        self.default_sink_idx = default_sink_idx
         if self.default_sink_idx is None:
             self.ctx.log("Default sink not found. This plugin will not work.")
             return
@@ -63,11 +73,16 @@ class Plugin:
 
     def on_pactl_event(self, stream, condition):
         line = stream.readline()
-        if line and f"Event 'change' on sink #{self.default_sink_idx}" == line.strip():
-            self.ctx.log("Sink event detected")
-            self.update_volume_notification()
+        if line:
+            self.on_pactl_line(line)
         return True  # Keep the watch active
 
+    def handle_pactl_line(self, line):
+        """Handle one line of the pactl subscribe output."""
+        if f"Event 'change' on sink #{self.default_sink_idx}" == line.strip():
+            self.ctx.log("Sink event detected", level=DEBUG)
+            self.update_volume_notification()
+
     def get_default_sink_index(self):
         try:
             # Default-Sink-Namen ermitteln
@@ -92,20 +107,39 @@ class Plugin:
             return None
 
     def update_volume_notification(self):
-        try:
-            # Get volume and mute status
-            volume_str = subprocess.check_output(["pactl", "get-sink-volume", "@DEFAULT_SINK@"], text=True, env=ENV)
-            mute_str = subprocess.check_output(["pactl", "get-sink-mute", "@DEFAULT_SINK@"], text=True, env=ENV)
+        # only the newest state is of interest, discard the result of an older query
+        if self.volume_query is not None:
+            self.volume_query.cancel()
+        self.volume_query = self.ctx.offload(self.read_volume, on_done=self.show_volume, on_error=self.on_volume_error)
+
+    @staticmethod
+    def read_volume():
+        """Get volume and mute status (blocking)."""
+        volume_str = subprocess.check_output(["pactl", "get-sink-volume", "@DEFAULT_SINK@"], text=True, env=ENV)
+        mute_str = subprocess.check_output(["pactl", "get-sink-mute", "@DEFAULT_SINK@"], text=True, env=ENV)
+        return volume_str, mute_str
+
+    def on_volume_error(self, e):
+        self.volume_query = None
+        if isinstance(e, FileNotFoundError):
+            self.ctx.log("pactl command not found.")
+        else:
+            self.ctx.log("Error updating volume notification: %s", e, level=ERROR)
 
+    def show_volume(self, result):
+        self.volume_query = None
+        volume_str, mute_str = result
+        try:
             is_muted = "yes" in mute_str.lower()
+            # Extract volume percentage using regex
+            match = re.search(r'(\d+)%', volume_str)
+            self.ctx.publish("volume", volume=int(match.group(1)) if match else None, muted=is_muted)
 
             if is_muted:
                 self.ctx.notify("Volume", "Muted", icon=self.muted_icon, replace_id=NOTIFICATION_ID)
                 self.last_volume = 0
                 return
 
-            # Extract volume percentage using regex
-            match = re.search(r'(\d+)%', volume_str)
             if match:
                 volume = int(match.group(1))
                 if volume == self.last_volume:
@@ -116,11 +150,9 @@ class Plugin:
                 self.ctx.notify(f"Volume: {volume}%", "", icon=icon, replace_id=NOTIFICATION_ID, progress=volume)
             else:
                 # Fallback if regex fails
-                self.ctx.log(f"Could not parse volume: {volume_str}")
-                self.ctx.notify("Volume", volume_str.strip(), icon=self.high_icon, replace_id=NOTIFICATION_ID, progress=volume)
+                self.ctx.log("Could not parse volume: %s", volume_str, level=ERROR)
+                self.ctx.notify("Volume", volume_str.strip(), icon=self.high_icon, replace_id=NOTIFICATION_ID)
 
-        except FileNotFoundError:
-            self.ctx.log("pactl command not found.")
         except Exception as e:
-            self.ctx.log(f"Error updating volume notification: {e}")
+            self.ctx.log("Error updating volume notification: %s", e, level=ERROR)
 
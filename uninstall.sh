@@ -5,7 +5,10 @@
 # --- Configuration ---
 SERVICE_NAME="system-notifier.service"
 SERVICE_FILE_PATH="$HOME/.config/systemd/user/$SERVICE_NAME"
+PATH_UNIT_NAME="system-notifier.path"
+PATH_UNIT_FILE_PATH="$HOME/.config/systemd/user/$PATH_UNIT_NAME"
 ICON_CACHE_DIR=".icon_cache"
+HISTORY_FILE="$HOME/.local/state/system-notifier/history"
 
 # --- Functions ---
 log() {
@@ -33,6 +36,13 @@ else
     log "Systemd service file not found. Skipping."
 fi
 
+# Remove the path unit of the on-demand mode
+if [ -f "$PATH_UNIT_FILE_PATH" ]; then
+    log "Removing path unit..."
+    systemctl --user disable --now "$PATH_UNIT_NAME"
+    rm "$PATH_UNIT_FILE_PATH"
+fi
+
 # Reload systemd user daemon
 log "Reloading systemd user daemon..."
 systemctl --user daemon-reload
@@ -45,4 +55,12 @@ else
     log "Icon cache directory not found. Skipping."
 fi
 
+# Remove the notification history
+if [ -f "$HISTORY_FILE" ]; then
+    log "Removing notification history..."
+    rm "$HISTORY_FILE"
+else
+    log "Notification history not found. Skipping."
+fi
+
 log "Uninstallation complete."
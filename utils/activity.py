@@ -0,0 +1,58 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Track when the last event was handled, to exit when the process is idle."""
+
+import time
+from gi.repository import GLib
+
+_last_activity = time.monotonic()
+
+
+def touch():
+    """Mark that an event was handled."""
+    global _last_activity
+    _last_activity = time.monotonic()
+
+def idle_time():
+    """Seconds since the last event."""
+    return time.monotonic() - _last_activity
+
+
+class IdleMonitor:
+    """Calls on_idle once no event was handled for timeout seconds.
+
+    busy is an optional callable; while it returns True the process is not
+    considered idle (e.g. while clients are connected).
+    """
+    def __init__(self, timeout: int, on_idle, busy=None):
+        self.timeout = timeout
+        self.on_idle = on_idle
+        self.busy = busy
+        touch()
+        GLib.timeout_add_seconds(self.timeout, self.check)
+
+    def check(self):
+        idle = idle_time()
+        if idle >= self.timeout:
+            if not (self.busy and self.busy()):
+                self.on_idle()
+                return GLib.SOURCE_REMOVE
+            delay = self.timeout
+        else:
+            # check again when the timeout could be reached the next time
+            delay = self.timeout - idle
+        GLib.timeout_add_seconds(max(1, round(delay)), self.check)
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,91 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio integration with the GLib main loop.
+
+PyGObject (>= 3.50) ships an asyncio event loop policy that runs asyncio on
+top of the GLib main context, so coroutines and GLib sources are dispatched
+by the same GLib.MainLoop. Plugins can use `async def` handlers which are
+scheduled as tasks on that loop.
+"""
+
+import asyncio
+import inspect
+
+from utils.helper import log, ERROR, WARNING
+
+try:
+    from gi.events import GLibEventLoopPolicy
+except ImportError:
+    GLibEventLoopPolicy = None
+
+_loop = None
+# keep references to running tasks, asyncio only holds weak references
+_tasks = set()
+
+
+def setup():
+    """Install the GLib based asyncio event loop. Returns the loop or None."""
+    global _loop
+    if GLibEventLoopPolicy is None:
+        log("PyGObject >= 3.50 is required to run async handlers concurrently.", level=WARNING)
+        return None
+    policy = GLibEventLoopPolicy()
+    asyncio.set_event_loop_policy(policy)
+    _loop = policy.get_event_loop()
+    return _loop
+
+def get_loop():
+    """Return the asyncio event loop or None if it is not available."""
+    return _loop
+
+
+def spawn(coro, tag="main"):
+    """Run a coroutine as a task on the main loop and log its exceptions.
+
+    Without the GLib asyncio integration the coroutine is run to completion
+    in a temporary event loop, which blocks the main loop like a synchronous
+    handler would.
+    """
+    if _loop is None:
+        try:
+            asyncio.run(coro)
+        except Exception as e:
+            log("Error in async handler: %s", e, tag=tag, level=ERROR)
+        return None
+    task = _loop.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(lambda t: _task_done(t, tag))
+    return task
+
+def call_handler(callback, args, tag="main"):
+    """Call a plugin handler. If it is a coroutine function a task is started."""
+    result = callback(*args)
+    if inspect.iscoroutine(result):
+        return spawn(result, tag)
+    return result
+
+async def run_blocking(func, *args):
+    """Run a blocking function in a worker thread and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def _task_done(task, tag):
+    _tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        log("Error in async handler: %s", exc, tag=tag, level=ERROR)
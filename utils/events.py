@@ -0,0 +1,104 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Publish the normalized plugin events on a local unix socket.
+
+Status bars and scripts can subscribe to the event socket instead of
+watching UPower, iwd, pactl, ... themselves. Every event is sent as a
+length-prefixed JSON message (see utils/ipc.py):
+
+    {"type": "event", "event": "volume", "plugin": "volume_pactl", "time": 1714550400.5, "volume": 40, "muted": false}
+
+A new subscriber first receives the last event of every kind (and source),
+so it knows the current state without waiting for the next change.
+"""
+
+import os
+import socket
+import time
+
+from utils.helper import log, DEBUG
+from utils.ipc import Server, MessageReader, encode_message, RECV_SIZE
+
+_server = None
+# in daemon mode the events are also sent to the agents, which publish them
+# in their sessions (see utils/multiuser.py)
+_relay = None
+# (event, source) -> encoded message of the last event
+_last_events = {}
+
+
+def get_event_socket(path: str):
+    """Resolve a socket path relative to $XDG_RUNTIME_DIR."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or f"/run/user/{os.getuid()}"
+    return os.path.join(runtime_dir, os.path.expanduser(path))
+
+def start(path: str, mode: int = 0o600):
+    """Start serving events on path."""
+    global _server
+    _server = Server(path, mode=mode, on_connect=send_last_events)
+    return _server
+
+def set_relay(server):
+    """Also broadcast every event to the clients of server."""
+    global _relay
+    _relay = server
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.close()
+        _server = None
+
+def subscriber_count():
+    return len(_server.clients) if _server is not None else 0
+
+def publish(plugin: str, event: str, source: str = None, **data):
+    """Send an event to all subscribers.
+
+    source distinguishes several objects with the same kind of event (e.g.
+    one bluetooth event per device), only the last event per source is kept
+    for new subscribers.
+    """
+    message = {"type": "event", "event": event, "plugin": plugin, "time": time.time()}
+    if source is not None:
+        message["source"] = source
+    message.update(data)
+    encoded = encode_message(message)
+    # kept even without a socket, an agent may connect to the daemon later
+    _last_events[(event, source)] = encoded
+    if _relay is not None:
+        _relay.send_all(encoded)
+    if _server is not None:
+        _server.send_all(encoded)
+
+def send_last_events(connection):
+    """Send the last event of every kind to a new subscriber (or agent)."""
+    for data in list(_last_events.values()):
+        if not connection.send(data):
+            return
+    log("Subscriber connected, sent %d events", len(_last_events), tag="events", level=DEBUG)
+
+
+def subscribe(path: str):
+    """Yield the events published on path (blocking, for the events command)."""
+    reader = MessageReader()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC) as sock:
+        sock.connect(path)
+        while True:
+            data = sock.recv(RECV_SIZE)
+            if not data:
+                return
+            yield from reader.feed(data)
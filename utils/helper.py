@@ -15,8 +15,192 @@
 
 """Helper functions"""
 
-from globals import LOG_FILE, LOG_TAG_WIDTH
+import atexit
+import os
+import threading
+import time
+from collections import deque
 
-def log(*args, tag="main", **kwargs):
-    """Helper for log messages"""
-    print(f"{"[" + tag + "]":{LOG_TAG_WIDTH}}", *args, file=LOG_FILE, **kwargs)
\ No newline at end of file
+from globals import LOG_FILE, LOG_TAG_WIDTH, LOG_BUFFER_SIZE, LOG_QUEUE_SIZE
+
+# log levels
+DEBUG   = 10
+INFO    = 20
+WARNING = 30
+ERROR   = 40
+
+LEVEL_NAMES = {
+    "debug": DEBUG,
+    "info": INFO,
+    "warning": WARNING,
+    "error": ERROR,
+}
+
+# level thresholds for writing to LOG_FILE (global and per tag)
+_default_level = INFO
+_tag_levels = {}
+# minimum level of records kept in the ring buffer
+_buffer_level = DEBUG
+# the most recent records, formatted only when the buffer is dumped
+_ring = deque(maxlen=LOG_BUFFER_SIZE)
+# log arguments of these types are stored as they are, everything else is
+# converted to a string when the record is created
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def parse_log_level(name: str) -> int:
+    """Convert a level name like 'debug' to its numeric value."""
+    try:
+        return LEVEL_NAMES[name.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown log level: {name}") from None
+
+def set_log_level(level: int, tag: str = None):
+    """Set the global threshold or the threshold for a single tag."""
+    global _default_level
+    if tag is None:
+        _default_level = level
+    else:
+        _tag_levels[tag] = level
+
+def set_buffer_level(level: int):
+    """Set the minimum level of records kept in the ring buffer."""
+    global _buffer_level
+    _buffer_level = level
+
+
+def log(msg, *args, tag="main", level=INFO):
+    """Helper for log messages
+
+    Like in the logging module msg is only formatted with args (msg % args)
+    when the record is actually written, so pass the arguments separately
+    on hot paths instead of using an f-string. Arguments that are not
+    strings or numbers (D-Bus dicts, exceptions, ...) are converted to
+    strings right away, so the ring buffer does not keep them (and their
+    tracebacks) alive and the writer thread never formats mutable objects.
+    """
+    threshold = _tag_levels.get(tag, _default_level)
+    if level < threshold and level < _buffer_level:
+        return
+    if not isinstance(msg, str):
+        msg = str(msg)
+    if args:
+        args = tuple(a if isinstance(a, _IMMUTABLE_TYPES) else str(a) for a in args)
+    record = (time.time(), level, tag, msg, args)
+    if level >= _buffer_level:
+        _ring.append(record)
+    if level >= threshold:
+        _writer.put(record)
+
+def dump_log_buffer(file=None):
+    """Write the content of the ring buffer to file (default: LOG_FILE)."""
+    file = file or LOG_FILE
+    records = list(_ring)
+    _writer.flush()
+    print(f"--- begin of log buffer ({len(records)} records) ---", file=file)
+    for record in records:
+        print(_format_record(record, with_time=True), file=file)
+    print("--- end of log buffer ---", file=file, flush=True)
+
+def flush_log():
+    """Block until all pending records are written."""
+    _writer.flush()
+
+
+def memory_usage():
+    """Resident set size of this process in KiB."""
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+def process_age():
+    """Seconds since this process was started."""
+    with open("/proc/self/stat") as f:
+        # the fields after the command name, starttime is field 22
+        fields = f.read().rsplit(")", 1)[1].split()
+    with open("/proc/uptime") as f:
+        uptime = float(f.read().split()[0])
+    return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+
+
+def _format_record(record, with_time=False):
+    timestamp, level, tag, msg, args = record
+    try:
+        message = str(msg) % args if args else str(msg)
+    except (TypeError, ValueError):
+        message = " ".join(str(a) for a in (msg, *args))
+    if level >= WARNING:
+        message = f"{_level_name(level).upper()}: {message}"
+    line = f"{"[" + tag + "]":{LOG_TAG_WIDTH}} {message}"
+    if with_time:
+        line = time.strftime("%H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d} " + line
+    return line
+
+def _level_name(level):
+    for name, value in LEVEL_NAMES.items():
+        if value == level:
+            return name
+    return str(level)
+
+
+class _LogWriter:
+    """Writes log records to LOG_FILE from a background thread.
+
+    Records are queued in a bounded deque, so logging never blocks the main
+    loop. If the writer falls behind (e.g. because of journald backpressure)
+    the oldest pending records are dropped and the number of dropped records
+    is reported.
+    """
+    def __init__(self, max_pending: int):
+        self.pending = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.thread = None
+
+    def put(self, record):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(record)
+        self.idle.clear()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+            self.thread.start()
+        self.wakeup.set()
+
+    def flush(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while self.thread is not None and time.monotonic() < deadline:
+            if self.idle.wait(0.05) and not self.pending:
+                return
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.write_pending()
+            if not self.pending:
+                self.idle.set()
+
+    def write_pending(self):
+        lines = []
+        while self.pending:
+            try:
+                lines.append(_format_record(self.pending.popleft()))
+            except IndexError:
+                break
+        if self.dropped:
+            lines.append(f"{"[log]":{LOG_TAG_WIDTH}} {self.dropped} log records dropped")
+            self.dropped = 0
+        if not lines:
+            return
+        try:
+            LOG_FILE.write("\n".join(lines) + "\n")
+            LOG_FILE.flush()
+        except (OSError, ValueError):
+            pass
+
+
+_writer = _LogWriter(LOG_QUEUE_SIZE)
+atexit.register(flush_log)
@@ -0,0 +1,275 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A fixed-size, memory-mapped ring of sent notifications.
+
+The file consists of a header followed by `capacity` records of fixed size.
+The header stores the total number of records ever written, so the slot of
+the next record is `written % capacity` and the oldest record is overwritten
+when the ring is full. Appending a record is a single struct.pack_into into
+the mapping; the kernel writes the pages back, there is no fsync.
+
+Records are stored in chronological order, so queries by time use a binary
+search and only touch the records in the requested range. If the clock is
+set back, new records get the timestamp of the newest record until the clock
+has caught up, which keeps the order intact.
+
+Several processes may write to the same file (e.g. two sessions of a user):
+appends and queries take a flock on the file and the slot is taken from the
+header, not from the state of the process. Appends never wait for the lock,
+entries are queued while another process holds it. A file with a different
+capacity is replaced by a new file instead of being resized, since shrinking
+a file another process has mapped would crash that process.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+
+from utils.helper import log, ERROR
+
+MAGIC = b"SNHIST1\0"
+# magic, record size, capacity, records written
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 64
+# timestamp, urgency, plugin, replace_id, summary, body
+RECORD = struct.Struct("<dB23s32s96s96s")
+
+URGENCIES = ("low", "normal", "critical")
+# entries queued while the file is locked by another process
+MAX_PENDING = 64
+
+
+class HistoryEntry:
+    """A notification read from the history."""
+    def __init__(self, timestamp, urgency, plugin, replace_id, summary, body):
+        self.timestamp = timestamp
+        self.urgency = urgency
+        self.plugin = plugin
+        self.replace_id = replace_id
+        self.summary = summary
+        self.body = body
+
+    def __str__(self):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.timestamp))
+        text = f"{when} [{self.plugin}] ({self.urgency}) {self.summary}"
+        if self.body:
+            text += " - " + self.body.replace("\n", " ")
+        return text
+
+
+class History:
+    """The notification history ring file."""
+    def __init__(self):
+        self.map = None
+        self.fd = None
+        self.capacity = 0
+        self.written = 0
+        # entries not written yet because another process held the lock
+        self.pending = deque(maxlen=MAX_PENDING)
+
+    def open(self, path: str, capacity: int = 0, readonly=False):
+        """
+        Open the ring file. If it is opened for writing, it is created (or
+        replaced by a new file if its capacity differs) with room for capacity records.
+        """
+        path = os.path.expanduser(path)
+        if readonly:
+            self.fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+            self.map = mmap.mmap(self.fd, 0, prot=mmap.PROT_READ)
+            self._read_header()
+            return
+
+        if capacity <= 0:
+            raise ValueError("the history needs a capacity of at least one record")
+        size = HEADER_SIZE + capacity * RECORD.size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # the descriptor stays open for the locks
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        try:
+            file_size = os.fstat(self.fd).st_size
+            if file_size not in (0, size):
+                # different capacity: another process may have the file mapped and
+                # would get SIGBUS if it was shrunk, so a new file replaces it
+                log(f"History capacity changed, starting a new history in {path}")
+                os.close(self.fd)
+                self.fd = _create(path, size)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self.fd).st_size == 0:
+                    # growing a new file is safe
+                    os.ftruncate(self.fd, size)
+                self.map = mmap.mmap(self.fd, size)
+                magic, record_size, file_capacity, _ = HEADER.unpack_from(self.map, 0)
+                if magic != MAGIC or record_size != RECORD.size or file_capacity != capacity:
+                    HEADER.pack_into(self.map, 0, MAGIC, RECORD.size, capacity, 0)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        except OSError:
+            self.close()
+            raise
+        self._read_header()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _read_header(self):
+        magic, record_size, self.capacity, self.written = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError("not a notification history file")
+
+    def append(self, plugin: str, summary: str, body: str, urgency: str, replace_id: str):
+        """
+        Add a notification to the ring. Does nothing if no file is open. If
+        another process holds the lock (e.g. a slow history query), the entry
+        is queued and written with the next one, the caller never blocks.
+        """
+        if self.map is None:
+            return
+        self.pending.append((time.time(), plugin, summary, body, urgency, replace_id))
+        fd = self.fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log(f"Cannot write notification history: {e}", level=ERROR)
+            return
+        try:
+            # another process may have appended since our last write
+            self._read_header()
+            while self.pending:
+                self._write(*self.pending.popleft())
+        except (OSError, ValueError, struct.error) as e:
+            log(f"Cannot write notification history: {e}", level=ERROR)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _write(self, timestamp, plugin, summary, body, urgency, replace_id):
+        if len(self):
+            # keep the records sorted when the clock was set back
+            timestamp = max(timestamp, self._timestamp(len(self) - 1))
+        offset = HEADER_SIZE + (self.written % self.capacity) * RECORD.size
+        RECORD.pack_into(self.map, offset,
+                         timestamp,
+                         URGENCIES.index(urgency) if urgency in URGENCIES else 1,
+                         _encode(plugin, 23), _encode(replace_id or "", 32),
+                         _encode(summary, 96), _encode(body, 96))
+        self.written += 1
+        HEADER.pack_into(self.map, 0, MAGIC, RECORD.size, self.capacity, self.written)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def _offset(self, index: int):
+        """File offset of the index-th oldest record."""
+        return HEADER_SIZE + ((self.written - len(self) + index) % self.capacity) * RECORD.size
+
+    def _timestamp(self, index: int):
+        return struct.unpack_from("<d", self.map, self._offset(index))[0]
+
+    def query(self, plugin: str = None, since: float = None, until: float = None):
+        """Yield the entries in the time range [since, until], oldest first."""
+        if self.map is None:
+            return
+        # copy the entries while holding the lock, so a writer cannot overwrite
+        # records under us but is not blocked by a slow consumer
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        try:
+            entries = list(self._query(plugin, since, until))
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        yield from entries
+
+    def _query(self, plugin, since, until):
+        self._read_header()
+        timestamps = _TimestampView(self)
+        start = bisect_left(timestamps, since) if since is not None else 0
+        end = bisect_right(timestamps, until) if until is not None else len(self)
+        plugin_field = _encode(plugin, 23) if plugin else None
+        for index in range(start, end):
+            fields = RECORD.unpack_from(self.map, self._offset(index))
+            if plugin_field and fields[2].rstrip(b"\0") != plugin_field:
+                continue
+            timestamp, urgency, plugin_name, replace_id, summary, body = fields
+            yield HistoryEntry(timestamp,
+                               URGENCIES[urgency] if urgency < len(URGENCIES) else "normal",
+                               _decode(plugin_name), _decode(replace_id),
+                               _decode(summary), _decode(body))
+
+
+def _create(path: str, size: int):
+    """Create an empty ring file of size bytes and atomically replace path with it."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    return fd
+
+
+class _TimestampView:
+    """Sequence of the record timestamps for bisect, read on access."""
+    def __init__(self, history: History):
+        self.history = history
+
+    def __len__(self):
+        return len(self.history)
+
+    def __getitem__(self, index):
+        return self.history._timestamp(index)
+
+
+def _encode(text: str, size: int):
+    data = text.encode("utf-8")[:size]
+    # don't store a cut multibyte character
+    return data.decode("utf-8", errors="ignore").encode("utf-8")
+
+def _decode(data: bytes):
+    return data.rstrip(b"\0").decode("utf-8", errors="replace")
+
+
+def parse_time(text: str):
+    """
+    Convert a time given on the command line to a timestamp. Accepts ISO
+    dates ('2024-05-01 12:00') and relative times ('30s', '15m', '2h', '1d').
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = text.strip()
+    if text[-1:] in units:
+        try:
+            return time.time() - float(text[:-1]) * units[text[-1]]
+        except ValueError:
+            pass
+    return datetime.fromisoformat(text).timestamp()
+
+
+# the history shared by all plugin contexts
+history = History()
@@ -15,10 +15,23 @@
 
 """ Provied the get_icon helper function. """
 
-from utils.helper import log
+from utils.helper import log, DEBUG, WARNING
+from utils import power
+import json
 import os
-import cairosvg
-from lxml import etree
+import shutil
+
+# remembers where icons were found, so a
+# restarted process does not have to search the theme again
+INDEX_FILE = "icon_index.json"
+_index = {}
+_index_file = None
+_index_theme_dir = None
+_index_dirty = False
+# SVG icons whose rasterization was deferred while on battery:
+# (icon_name, svg_path, cache_dir)
+_deferred = set()
+_deferred_listener = False
 
 
 def get_icon(icon_name: str, theme_dir: str, cache_dir: str):
@@ -34,21 +47,35 @@ def get_icon(icon_name: str, theme_dir: str, cache_dir: str):
     if os.path.isfile(icon_name):
         return os.path.realpath(icon_name)
 
+    # check if the icon was resolved before
+    _load_index(theme_dir, cache_dir)
+    known_path = _index.get(icon_name)
+    if known_path and os.path.isfile(known_path):
+        return known_path
+
     # check if the icon is already in the cache dir return it's path
     if os.path.isfile(os.path.join(cache_dir, icon_name+".png")):
-        return os.path.realpath(os.path.join(cache_dir, icon_name+".png"))
+        return _remember(icon_name, os.path.realpath(os.path.join(cache_dir, icon_name+".png")))
     
     # find the icon in the icon theme directory
     file_path: str = ""
     try:
         file_path = _find_icon_file(icon_name, theme_dir)
-        log("Using icon: " + file_path)
+        log("Using icon: %s", file_path, level=DEBUG)
     except FileNotFoundError:
-        log("cannot find icon: " + icon_name)
+        log("cannot find icon: %s", icon_name, level=WARNING)
         return ""
     
     # convert if necessary
-    if file_path.endswith(".svg"):
+    if file_path.endswith(".svg") and power.on_battery():
+        # notification servers can show SVG files, convert it when on AC again
+        global _deferred_listener
+        if not _deferred_listener:
+            _deferred_listener = True
+            power.add_listener(_convert_deferred)
+        _deferred.add((icon_name, file_path, cache_dir))
+        return os.path.realpath(file_path)
+    elif file_path.endswith(".svg"):
         try:
             file_path = _convert_svg_to_png(icon_name, file_path, cache_dir)
         except Exception:
@@ -62,18 +89,71 @@ def get_icon(icon_name: str, theme_dir: str, cache_dir: str):
             log("Cannot copy icon file")
             return ""
 
-    return os.path.realpath(file_path)
+    return _remember(icon_name, os.path.realpath(file_path))
+
+def save_icon_index():
+    """Write the icon index to the cache dir if it changed."""
+    global _index_dirty
+    if not _index_dirty or _index_file is None:
+        return
+    try:
+        _get_cache_dir(os.path.dirname(_index_file))
+        tmp_file = _index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"theme_dir": _index_theme_dir, "icons": _index}, f)
+        os.replace(tmp_file, _index_file)
+        _index_dirty = False
+    except OSError as e:
+        log(f"Cannot write icon index: {e}", level=WARNING)
+
+def _load_index(theme_dir: str, cache_dir: str):
+    global _index_file, _index_theme_dir, _index_dirty
+    index_file = os.path.join(cache_dir, INDEX_FILE)
+    if (index_file, theme_dir) == (_index_file, _index_theme_dir):
+        return
+    _index_file, _index_theme_dir = index_file, theme_dir
+    _index.clear()
+    _index_dirty = False
+    try:
+        with open(index_file) as f:
+            data = json.load(f)
+        # the entries are only valid for the theme they were searched in
+        if data.get("theme_dir") == theme_dir:
+            _index.update(data.get("icons", {}))
+    except (OSError, ValueError, AttributeError):
+        pass
+
+def _remember(icon_name: str, path: str):
+    global _index_dirty
+    if _index.get(icon_name) != path:
+        _index[icon_name] = path
+        _index_dirty = True
+    return path
+
+def _convert_deferred(mode):
+    """Rasterize the deferred SVG icons once on AC, so the next start finds the PNGs in the cache."""
+    if mode != power.AC:
+        return
+    while _deferred:
+        icon_name, svg_path, cache_dir = _deferred.pop()
+        try:
+            _remember(icon_name, os.path.realpath(_convert_svg_to_png(icon_name, svg_path, cache_dir)))
+        except Exception:
+            log("Cannot convert icon file %s", svg_path, level=WARNING)
+    save_icon_index()
 
 def _copy_to_cache_dir(file_path: str, cache_dir: str):
     cache_dir = _get_cache_dir(cache_dir)
     new_path = os.path.join(cache_dir, os.path.basename(file_path))
-    os.copy_file_range(file_path, new_path)
+    shutil.copyfile(file_path, new_path)
     return new_path
 
 
 def _convert_svg_to_png(icon_name: str, svg_path: str, cache_dir: str):
     cache_dir = _get_cache_dir(cache_dir)
     png_path = os.path.join(cache_dir, icon_name + ".png")
+    # imported here, so processes that only use cached icons don't load it
+    import cairosvg
     cairosvg.svg2png(url=svg_path, write_to=png_path, dpi=96, output_width=256)
     return png_path
 
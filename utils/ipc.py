@@ -0,0 +1,273 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Length-prefixed JSON messages over unix sockets, driven by the GLib main loop.
+
+Every message is a 4 byte big-endian length followed by a UTF-8 encoded JSON
+object. The Server broadcasts messages to all connected clients. Every client
+has a bounded output buffer; a client that does not read fast enough to stay
+below the limit is disconnected instead of slowing down the server.
+"""
+
+import errno
+import json
+import os
+import socket
+import struct
+from gi.repository import GLib
+
+from utils.helper import log, DEBUG, WARNING
+
+LENGTH = struct.Struct(">I")
+# messages larger than this are considered a protocol error
+MAX_MESSAGE_SIZE = 1024 * 1024
+# default limit for the output buffer of a client
+MAX_BUFFER = 256 * 1024
+RECV_SIZE = 64 * 1024
+
+
+def encode_message(message: dict) -> bytes:
+    data = json.dumps(message, separators=(",", ":"), default=str).encode("utf-8")
+    return LENGTH.pack(len(data)) + data
+
+
+class MessageReader:
+    """Splits a byte stream into messages."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes):
+        """Add received data and return the complete messages."""
+        self.buffer += data
+        messages = []
+        while len(self.buffer) >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(self.buffer)
+            if length > MAX_MESSAGE_SIZE:
+                raise ValueError(f"message too large ({length} bytes)")
+            if len(self.buffer) < LENGTH.size + length:
+                break
+            data = bytes(self.buffer[LENGTH.size:LENGTH.size + length])
+            del self.buffer[:LENGTH.size + length]
+            messages.append(json.loads(data))
+        return messages
+
+
+class Connection:
+    """A non-blocking socket with an output buffer, watched by GLib."""
+    def __init__(self, sock, on_message=None, on_close=None, max_buffer=MAX_BUFFER):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.on_message = on_message
+        self.on_close = on_close
+        self.max_buffer = max_buffer
+        self.reader = MessageReader()
+        self.out = bytearray()
+        self.out_watch = None
+        self.in_watch = GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_DEFAULT,
+                                          GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self._on_readable)
+        self.closed = False
+
+    def send(self, data: bytes):
+        """Queue encoded message data. Returns False if the connection was dropped."""
+        if self.closed:
+            return False
+        if len(self.out) + len(data) > self.max_buffer:
+            log("Dropping slow client (output buffer full)", tag="ipc", level=WARNING)
+            self.close()
+            return False
+        self.out += data
+        self._flush()
+        return not self.closed
+
+    def _flush(self):
+        while self.out:
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                break
+            except OSError:
+                self.close()
+                return
+            del self.out[:sent]
+        if self.out and self.out_watch is None:
+            self.out_watch = GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_DEFAULT,
+                                               GLib.IO_OUT, self._on_writable)
+        elif not self.out and self.out_watch is not None:
+            GLib.source_remove(self.out_watch)
+            self.out_watch = None
+
+    def _on_writable(self, fd, condition):
+        self.out_watch = None
+        self._flush()
+        return GLib.SOURCE_REMOVE
+
+    def _on_readable(self, fd, condition):
+        try:
+            data = self.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return GLib.SOURCE_CONTINUE
+        except OSError:
+            data = b""
+        if not data:
+            self.in_watch = None
+            self.close()
+            return GLib.SOURCE_REMOVE
+        try:
+            messages = self.reader.feed(data)
+        except ValueError as e:
+            log(f"Invalid message: {e}", tag="ipc", level=WARNING)
+            self.in_watch = None
+            self.close()
+            return GLib.SOURCE_REMOVE
+        if self.on_message:
+            for message in messages:
+                self.on_message(self, message)
+        return GLib.SOURCE_CONTINUE
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for watch in (self.in_watch, self.out_watch):
+            if watch is not None:
+                GLib.source_remove(watch)
+        self.in_watch = self.out_watch = None
+        self.sock.close()
+        if self.on_close:
+            self.on_close(self)
+
+
+def _is_listening(path: str):
+    """Check whether a process accepts connections on the unix socket path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class Server:
+    """Accepts clients on a unix socket and broadcasts messages to them.
+
+    If fd is given, it is a listening socket passed by systemd socket
+    activation and path is not created (nor removed on close).
+    on_connect(connection) is called for every new client.
+    """
+    def __init__(self, path: str, mode: int = 0o600, on_message=None, max_buffer=MAX_BUFFER, fd=None,
+                 on_connect=None):
+        self.path = path
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.max_buffer = max_buffer
+        self.clients = set()
+        self.owns_path = fd is None
+
+        if fd is not None:
+            self.sock = socket.socket(fileno=fd)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path):
+                if _is_listening(path):
+                    # don't steal the socket of a running instance
+                    raise OSError(errno.EADDRINUSE, f"{path} is in use, another instance is already running")
+                # left behind by a process that did not exit cleanly
+                os.unlink(path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+            self.sock.bind(path)
+            os.chmod(path, mode)
+            self.sock.listen(16)
+        self.sock.setblocking(False)
+        self.watch = GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_DEFAULT,
+                                       GLib.IO_IN, self._on_accept)
+
+    def _on_accept(self, fd, condition):
+        try:
+            sock, _ = self.sock.accept()
+        except BlockingIOError:
+            return GLib.SOURCE_CONTINUE
+        client = Connection(sock, on_message=self.on_message,
+                            on_close=self.clients.discard, max_buffer=self.max_buffer)
+        self.clients.add(client)
+        log("Client connected (%d clients)", len(self.clients), tag="ipc", level=DEBUG)
+        if self.on_connect:
+            self.on_connect(client)
+        return GLib.SOURCE_CONTINUE
+
+    def broadcast(self, message: dict):
+        """Send a message to all clients. It is encoded only once."""
+        if not self.clients:
+            return
+        self.send_all(encode_message(message))
+
+    def send_all(self, data: bytes):
+        """Send encoded message data to all clients."""
+        for client in list(self.clients):
+            client.send(data)
+
+    def close(self):
+        GLib.source_remove(self.watch)
+        for client in list(self.clients):
+            client.close()
+        self.sock.close()
+        if not self.owns_path:
+            return
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class Client:
+    """Connects to a Server and reconnects if the connection is lost."""
+    def __init__(self, path: str, on_message, retry_interval: int = 5):
+        self.path = path
+        self.on_message = on_message
+        self.retry_interval = retry_interval
+        self.connection = None
+        self.retry_timer = None
+        self.closed = False
+        self.connect()
+
+    def connect(self):
+        self.retry_timer = None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            log("Cannot connect to %s: %s", self.path, e, tag="ipc", level=DEBUG)
+            self.retry_timer = GLib.timeout_add_seconds(self.retry_interval, self.connect)
+            return GLib.SOURCE_REMOVE
+        self.connection = Connection(sock, on_message=lambda conn, msg: self.on_message(msg),
+                                     on_close=self._on_close)
+        log(f"Connected to {self.path}", tag="ipc")
+        return GLib.SOURCE_REMOVE
+
+    def _on_close(self, connection):
+        self.connection = None
+        if self.closed:
+            return
+        log(f"Connection to {self.path} lost", tag="ipc", level=WARNING)
+        self.retry_timer = GLib.timeout_add_seconds(self.retry_interval, self.connect)
+
+    def close(self):
+        """Disconnect and stop reconnecting."""
+        self.closed = True
+        if self.retry_timer is not None:
+            GLib.source_remove(self.retry_timer)
+            self.retry_timer = None
+        if self.connection is not None:
+            self.connection.close()
@@ -0,0 +1,164 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Attribute memory allocations to plugins with tracemalloc.
+
+Every allocation is attributed to the innermost frame of its traceback that
+lies in the plugins directory, so memory allocated by helpers (e.g. the
+active_notifications of a PluginContext or pydbus proxies) on behalf of a
+plugin is counted for that plugin. Each report is compared to the previous
+one and to the baseline taken after the plugins were loaded.
+"""
+
+import os
+import tracemalloc
+from gi.repository import GLib
+
+from utils.helper import log
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins") + os.sep
+# number of frames stored per allocation, enough to reach the plugin frame
+# from inside pydbus and GLib callbacks
+TRACE_FRAMES = 25
+TOP_SITES = 10
+
+
+def _format_size(size: int):
+    if abs(size) < 1024:
+        return f"{size} B"
+    return f"{size / 1024:.1f} KiB"
+
+
+class Usage:
+    """Memory attributed to plugins in one snapshot."""
+    def __init__(self, snapshot):
+        # plugin -> [size, blocks]
+        self.plugins = {}
+        # (file, line) -> [size, blocks]
+        self.sites = {}
+        for trace in snapshot.traces:
+            # the frames are sorted from the oldest to the most recent
+            for frame in reversed(trace.traceback):
+                if frame.filename.startswith(PLUGINS_DIR):
+                    break
+            else:
+                continue
+            plugin = os.path.splitext(frame.filename[len(PLUGINS_DIR):])[0]
+            for table, key in ((self.plugins, plugin), (self.sites, (frame.filename, frame.lineno))):
+                entry = table.setdefault(key, [0, 0])
+                entry[0] += trace.size
+                entry[1] += 1
+
+    @staticmethod
+    def growth(new: dict, old: dict):
+        """Return (key, size diff, blocks diff) for all keys, largest growth first."""
+        diffs = []
+        for key in new.keys() | old.keys():
+            size, blocks = new.get(key, (0, 0))
+            old_size, old_blocks = old.get(key, (0, 0))
+            diffs.append((key, size - old_size, blocks - old_blocks))
+        diffs.sort(key=lambda diff: diff[1], reverse=True)
+        return diffs
+
+
+class MemoryReporter:
+    """Logs the memory used by every plugin and the top growth sites."""
+    def __init__(self, plugins: dict, top: int = TOP_SITES):
+        self.plugins = plugins
+        self.top = top
+        self.baseline = None
+        self.previous = None
+        self.timer = None
+
+    @staticmethod
+    def start_tracing(frames: int = TRACE_FRAMES):
+        """Start tracing allocations. Call this before the plugins are loaded."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing() and self.baseline is not None
+
+    def start(self, interval: int = 0):
+        """Take the baseline snapshot and log a report every interval seconds."""
+        self.start_tracing()
+        self.baseline = self.previous = self.take_snapshot()
+        log(f"Memory tracing started, {_format_size(self.total(self.baseline))} attributed to plugins",
+            tag="memory")
+        if interval > 0 and self.timer is None:
+            self.timer = GLib.timeout_add_seconds(interval, self.on_timer)
+
+    def on_timer(self):
+        self.report()
+        return GLib.SOURCE_CONTINUE
+
+    def trigger(self):
+        """Runtime trigger: start tracing on the first call, report on later calls."""
+        if self.tracing:
+            self.report()
+        else:
+            self.start()
+
+    @staticmethod
+    def take_snapshot():
+        snapshot = tracemalloc.take_snapshot()
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(True, PLUGINS_DIR + "*", all_frames=True)])
+        return Usage(snapshot)
+
+    @staticmethod
+    def total(usage: Usage):
+        return sum(size for size, blocks in usage.plugins.values())
+
+    def report(self):
+        """Log the usage per plugin and the sites that grew the most since the last report."""
+        usage = self.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        log(f"Memory report: {_format_size(self.total(usage))} attributed to plugins, "
+            f"{_format_size(current)} traced in total (peak {_format_size(peak)})", tag="memory")
+
+        # a plugin that only appeared in the previous snapshot is in neither of these keys
+        since_start = {plugin: size for plugin, size, blocks in Usage.growth(usage.plugins, self.baseline.plugins)}
+        for plugin, size, blocks in Usage.growth(usage.plugins, self.previous.plugins):
+            total, total_blocks = usage.plugins.get(plugin, (0, 0))
+            log(f"  {plugin}: {_format_size(total)} in {total_blocks} blocks, "
+                f"{_format_size(size)} since last report, {_format_size(since_start.get(plugin, 0))} since start",
+                tag="memory")
+            for line in self.container_sizes(plugin):
+                log(f"    {line}", tag="memory")
+
+        growth = [diff for diff in Usage.growth(usage.sites, self.previous.sites) if diff[1] > 0]
+        if growth:
+            log(f"Top {min(self.top, len(growth))} growth sites since last report:", tag="memory")
+        for (filename, lineno), size, blocks in growth[:self.top]:
+            log(f"  {os.path.relpath(filename, os.path.dirname(PLUGINS_DIR[:-1]))}:{lineno}: "
+                f"+{_format_size(size)} in {blocks:+d} blocks", tag="memory")
+        self.previous = usage
+
+    def container_sizes(self, plugin: str):
+        """Describe the size of the containers held by a plugin, the usual suspects for leaks."""
+        instance = self.plugins.get(plugin)
+        if instance is None:
+            return []
+        objects = {plugin: instance}
+        ctx = getattr(instance, "ctx", None)
+        if ctx is not None:
+            objects["ctx"] = ctx
+        lines = []
+        for owner, obj in objects.items():
+            for name, value in vars(obj).items():
+                if isinstance(value, (dict, list, set)) and value:
+                    lines.append(f"{owner}.{name}: {len(value)} entries")
+        return lines
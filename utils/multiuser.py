@@ -0,0 +1,68 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Multi-user mode: one system daemon, one thin agent per session.
+
+The daemon (--daemon) runs the plugins that watch the system bus, resolves
+their icons into its (shared, world readable) icon cache and broadcasts every
+notification to the connected agents instead of showing it. An agent
+(--agent) connects to the daemon and shows the received notifications in its
+session. Agents can still load plugins for session resources themselves
+(e.g. volume_pactl). The daemon's plugin events are relayed the same way
+and published on the agent's event socket; a new agent first receives the
+last event of every kind, so its subscribers know the current state.
+"""
+
+from utils.helper import log, WARNING
+from utils import events
+from utils.ipc import Client
+from utils.plugin_loader import PluginContext
+
+
+class Agent:
+    """Shows the notifications broadcast by the daemon in this session."""
+    def __init__(self, config, socket_path: str):
+        self.config = config
+        # one context per remote plugin, so replace_ids work as usual
+        self.contexts = {}
+        self.client = Client(socket_path, self.on_message)
+
+    def close(self):
+        self.client.close()
+
+    def get_context(self, plugin: str):
+        if plugin not in self.contexts:
+            self.contexts[plugin] = PluginContext(plugin, self.config)
+        return self.contexts[plugin]
+
+    def on_message(self, message: dict):
+        try:
+            if message["type"] == "event":
+                data = {k: v for k, v in message.items() if k not in ("type", "plugin", "event", "source", "time")}
+                events.publish(message["plugin"], message["event"], message.get("source"), **data)
+                return
+            ctx = self.get_context(message["plugin"])
+            if message["type"] == "notify":
+                ctx.notify(message["summary"],
+                           body=message.get("body", ""),
+                           icon=message.get("icon", ""),
+                           urgency=message.get("urgency", "normal"),
+                           timeout=message.get("timeout"),
+                           replace_id=message.get("replace_id"),
+                           progress=message.get("progress"))
+            elif message["type"] == "close":
+                ctx.close_notification(message["replace_id"])
+        except (KeyError, TypeError) as e:
+            log(f"Invalid message from daemon: {e}", tag="agent", level=WARNING)
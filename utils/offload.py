@@ -0,0 +1,194 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run blocking calls in a shared thread pool and deliver the results on the main loop.
+
+All plugins share one bounded pool. Every plugin has an Offloader which
+limits how many of its calls run at the same time; further calls wait in a
+bounded queue. The result (or exception) of a call is passed to its
+callbacks from the GLib main loop, so callbacks never run in a worker
+thread and need no locking.
+
+While a trace is recorded the results are written to it, while a trace is
+replayed the calls are answered from it (see utils/recorder.py).
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from gi.repository import GLib
+
+from utils.helper import log, ERROR, WARNING
+from utils.async_loop import call_handler
+from utils.recorder import recorder
+
+MAX_WORKERS = 4
+# calls of one plugin running at the same time
+CONCURRENCY_LIMIT = 2
+# calls of one plugin waiting for a free slot
+MAX_PENDING = 32
+
+_executor = None
+_max_workers = MAX_WORKERS
+_shut_down = False
+
+
+def configure(max_workers: int):
+    """Set the size of the pool. Must be called before the first call is offloaded."""
+    global _max_workers
+    _max_workers = max(1, max_workers)
+
+def get_executor():
+    """Return the shared thread pool, it is created on first use."""
+    global _executor
+    if _shut_down:
+        raise RuntimeError("the offload pool is shut down")
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="offload")
+    return _executor
+
+def shutdown():
+    """Stop the pool without waiting for running calls."""
+    global _executor, _shut_down
+    _shut_down = True
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class OffloadHandle:
+    """An offloaded call. cancel() discards its result."""
+    def __init__(self, offloader, func, args, on_done, on_error, on_cancel):
+        self.offloader = offloader
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.future = None
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """Cancel the call. A call that is already running is not interrupted,
+        but its callbacks are not called."""
+        if self.done or self.cancelled:
+            return
+        self.cancelled = True
+        if self.future is None:
+            self.offloader.pending.remove(self)
+        else:
+            self.future.cancel()
+
+    def drop(self):
+        """Cancel the call on behalf of the offloader and tell the owner (on_cancel)."""
+        if self.done or self.cancelled:
+            return
+        self.cancel()
+        self._notify_cancel()
+
+    def _notify_cancel(self):
+        if self.on_cancel is not None:
+            try:
+                self.on_cancel()
+            except Exception as e:
+                log("Error in offload callback: %s", e, tag=self.offloader.tag, level=ERROR)
+
+
+class Offloader:
+    """Runs the blocking calls of one plugin with a concurrency limit."""
+    def __init__(self, tag: str, limit: int = CONCURRENCY_LIMIT, max_pending: int = MAX_PENDING):
+        self.tag = tag
+        self.limit = max(1, limit)
+        self.max_pending = max_pending
+        self.running = 0
+        self.pending = deque()
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_cancel=None):
+        """Run func(*args) in the pool. on_done(result) or on_error(exception)
+        is called on the main loop. on_cancel() is called instead if the call
+        is dropped by the offloader (queue full, pool shut down), but not
+        after handle.cancel(). Returns an OffloadHandle."""
+        handle = OffloadHandle(self, func, args, on_done, on_error, on_cancel)
+        if self.running < self.limit:
+            self._start(handle)
+            return handle
+        if len(self.pending) >= self.max_pending:
+            # the oldest call is the most likely to be outdated
+            log("Too many pending calls, dropping the oldest", tag=self.tag, level=WARNING)
+            self.pending[0].drop()
+        self.pending.append(handle)
+        return handle
+
+    def _start(self, handle):
+        self.running += 1
+        if recorder.replaying:
+            handle.future = self._replay(handle)
+            handle.future.add_done_callback(lambda future: GLib.idle_add(self._finished, handle))
+            return
+        try:
+            handle.future = get_executor().submit(handle.func, *handle.args)
+        except RuntimeError as e:
+            # the pool was shut down
+            self.running -= 1
+            handle.cancelled = True
+            log("Cannot offload call: %s", e, tag=self.tag, level=WARNING)
+            handle._notify_cancel()
+            return
+        handle.future.add_done_callback(lambda future: GLib.idle_add(self._finished, handle))
+
+    def _replay(self, handle):
+        """Answer a call with its recorded result instead of running it."""
+        future = Future()
+        try:
+            future.set_result(recorder.replay_result(self.tag, _call_name(handle.func)))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _finished(self, handle):
+        """Called on the main loop when a call finished (or was cancelled)."""
+        self.running -= 1
+        handle.done = True
+        while self.pending and self.running < self.limit:
+            self._start(self.pending.popleft())
+
+        if handle.future.cancelled():
+            if not handle.cancelled:
+                # cancelled by the shutdown of the pool
+                handle._notify_cancel()
+            return GLib.SOURCE_REMOVE
+        exc = handle.future.exception()
+        if not recorder.replaying:
+            # also for calls cancelled by their owner, a replay runs (and consumes) them as well
+            recorder.record_result(self.tag, _call_name(handle.func),
+                                   None if exc else handle.future.result(), exc)
+        if handle.cancelled:
+            return GLib.SOURCE_REMOVE
+        try:
+            if exc is None:
+                if handle.on_done is not None:
+                    call_handler(handle.on_done, (handle.future.result(),), tag=self.tag)
+            elif handle.on_error is not None:
+                call_handler(handle.on_error, (exc,), tag=self.tag)
+            else:
+                log("Error in offloaded call %s: %s", _call_name(handle.func), exc,
+                    tag=self.tag, level=ERROR)
+        except Exception as e:
+            log("Error in offload callback: %s", e, tag=self.tag, level=ERROR)
+        return GLib.SOURCE_REMOVE
+
+
+def _call_name(func):
+    return getattr(func, "__name__", str(func))
@@ -14,10 +14,16 @@
 # along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
 
 from globals import DEFAULT_PLUGIN_LIST, ICON_CACHE_DIR, ICON_THEME_DIR
-from utils.helper import log
+from utils.helper import log, parse_log_level, set_log_level, INFO
 from utils.icon_loader import get_icon
+from utils.recorder import recorder
+from utils.async_loop import call_handler, run_blocking, get_loop
+from utils.offload import Offloader, CONCURRENCY_LIMIT
+from utils.history import history
+from utils import activity, events, power
 
 from typing import Literal
+import asyncio
 import importlib
 import gi
 gi.require_version("Gtk", "3.0")
@@ -26,6 +32,14 @@ from gi.repository import Notify
 from gi.repository import GLib
 
 
+# set in daemon mode: notifications are broadcast to the agents instead of shown
+_notification_server = None
+
+def set_notification_server(server):
+    """Send all notifications to server (see utils/multiuser.py)."""
+    global _notification_server
+    _notification_server = server
+
 
 class PluginContext:
     """A container for shared ressources passed to each plugin."""
@@ -34,7 +48,8 @@ class PluginContext:
         self.plugin = plugin_name
 
         # set the global config settings every module might need
-        self.cache_dir = self.config.get("main", "cache_dir", fallback=ICON_CACHE_DIR)
+        self.cache_dir = self.config.get("main", "icon_cache_dir",
+                                         fallback=self.config.get("main", "cache_dir", fallback=ICON_CACHE_DIR))
         self.theme_dir = self.config.get("main", "icon_theme_dir", fallback=ICON_THEME_DIR)
 
         # load the global timeout and overwrite it if there is an module specific setting
@@ -43,11 +58,43 @@ class PluginContext:
         
         # map replace_id's on the associated notification object.
         self.active_notifications = {}
+
+        # low priority plugins pause their polling on battery (see utils/power.py)
+        self.low_priority = self.config.getboolean(self.plugin, "low_priority", fallback=False)
+
+        # blocking calls of this plugin, see offload()
+        self.offloader = Offloader(self.plugin, limit=int(self.get_config("offload_limit", fallback=CONCURRENCY_LIMIT)))
+
+        # plugin specific log level
+        log_level = self.get_config("log_level")
+        if log_level:
+            try:
+                set_log_level(parse_log_level(log_level), tag=self.plugin)
+            except ValueError as e:
+                self.log(str(e))
     
-    def log(self, *args, **kwargs):
+    def log(self, msg, *args, level=INFO):
         """Helper for log messages"""
-        log(*args, tag=self.plugin, **kwargs)
+        log(msg, *args, tag=self.plugin, level=level)
     
+    def handler(self, callback):
+        """
+        Wrap a callback which is connected to a D-Bus signal or another event
+        source. The wrapped callback records every call while a trace is
+        recorded (see --record and --replay).
+        If callback is a coroutine function it is run as a task on the main loop.
+        """
+        name = callback.__name__
+        def wrapper(*args):
+            if recorder.replaying:
+                # only the events of the trace are delivered during a replay
+                return None
+            activity.touch()
+            power.wakeup()
+            recorder.record(self.plugin, name, args)
+            return call_handler(callback, args, tag=self.plugin)
+        return wrapper
+
     def get_config(self, option, fallback=None):
         """Read a value from the plugin's config."""
         return self.config.get(self.plugin, option, fallback=fallback)
@@ -59,7 +106,53 @@ class PluginContext:
         """
         final_name = self.get_config(config_key, fallback=fallback)
         return get_icon(final_name, self.theme_dir, self.cache_dir)
+
+    async def get_icon_async(self, config_key: str, fallback: str):
+        """Like get_icon() but searches and converts the icon in a worker thread."""
+        final_name = self.get_config(config_key, fallback=fallback)
+        return await self.call_async(get_icon, final_name, self.theme_dir, self.cache_dir)
+
+    def offload(self, func, *args, on_done=None, on_error=None, on_cancel=None):
+        """
+        Run a blocking call (e.g. a D-Bus method call, a sysfs read or a
+        subprocess) in the shared thread pool. on_done(result) or
+        on_error(exception) is called on the main loop when it finished;
+        without on_error exceptions are logged. At most offload_limit calls
+        of a plugin run at the same time, the others wait in a queue; when it
+        is full the oldest call is dropped and its on_cancel() is called.
+        Returns a handle whose cancel() method discards the call.
+        """
+        return self.offloader.submit(func, *args, on_done=on_done, on_error=on_error, on_cancel=on_cancel)
+
+    async def call_async(self, func, *args):
+        """Like offload() but await the result in an async handler."""
+        loop = get_loop()
+        if loop is None:
+            # the GLib main loop does not run while asyncio.run() blocks it
+            return await run_blocking(func, *args)
+        future = loop.create_future()
+        def set_result(result):
+            if not future.done():
+                future.set_result(result)
+        def set_exception(exc):
+            if not future.done():
+                future.set_exception(exc)
+        # a dropped call cancels the awaiting task instead of leaving it hanging
+        handle = self.offload(func, *args, on_done=set_result, on_error=set_exception, on_cancel=future.cancel)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            handle.cancel()
+            raise
     
+    def publish(self, event: str, source: str = None, **data):
+        """
+        Publish a normalized event (e.g. publish("volume", volume=40, muted=False))
+        to the subscribers of the event socket. source distinguishes several
+        objects sending the same kind of event, e.g. bluetooth devices.
+        """
+        events.publish(self.plugin, event, source, **data)
+
     def notify(self,
                summary: str,
                body: str = "",
@@ -69,6 +162,38 @@ class PluginContext:
                replace_id: str = None,
                progress: int = None):
         """Send a desktop notification"""
+        if _notification_server is not None:
+            _notification_server.broadcast({
+                "type": "notify",
+                "plugin": self.plugin,
+                "summary": summary,
+                "body": body,
+                "icon": icon,
+                "urgency": urgency,
+                "timeout": timeout if timeout is not None else self.notification_timeout,
+                "replace_id": replace_id,
+                "progress": progress,
+            })
+            return
+        self._prepare_notification(summary, body, icon, urgency, timeout, replace_id, progress).show()
+
+    async def notify_async(self,
+                           summary: str,
+                           body: str = "",
+                           icon: str = "",
+                           urgency: Literal["low", "normal", "critical"] = "normal",
+                           timeout: int = None,
+                           replace_id: str = None,
+                           progress: int = None):
+        """
+        notify() for async handlers. The notification is shown on the main
+        loop: libnotify objects are not thread-safe and the object of a
+        replace_id is updated by every later notify() with the same id.
+        """
+        self.notify(summary, body, icon, urgency, timeout, replace_id, progress)
+
+    def _prepare_notification(self, summary, body, icon, urgency, timeout, replace_id, progress):
+        """Create or update the notification object for notify()."""
         urgency_map = {
             "low": Notify.Urgency.LOW,
             "normal": Notify.Urgency.NORMAL,
@@ -94,14 +219,18 @@ class PluginContext:
         if progress is not None:
             notification_to_show.set_hint("value", GLib.Variant.new_int32(progress))
 
-        notification_to_show.show()
-
         # if there is a replace_id add it to the active_notifications map
         if replace_id:
             self.active_notifications[replace_id] = notification_to_show
 
+        history.append(self.plugin, summary, body, urgency, replace_id)
+        return notification_to_show
+
     def close_notification(self, replace_id: str):
         """Actively close a notification"""
+        if _notification_server is not None:
+            _notification_server.broadcast({"type": "close", "plugin": self.plugin, "replace_id": replace_id})
+            return
         if replace_id in self.active_notifications:
             self.active_notifications[replace_id].close()
             del self.active_notifications[replace_id]
@@ -120,7 +249,7 @@ def load_plugins(config, plugin_list=""):
     log(f"Enabled plugins: {', '.join(enabled_plugins) if enabled_plugins else 'None'}")
 
     # load the modules
-    loaded_plugins = []
+    loaded_plugins = {}
     for plugin_name in enabled_plugins:
         module_name = f"plugins.{plugin_name}"
         try:
@@ -128,8 +257,19 @@ def load_plugins(config, plugin_list=""):
             if hasattr(module, 'Plugin'):
                 context = PluginContext(plugin_name, config)
                 plugin_instance = module.Plugin(context)
-                loaded_plugins.append(plugin_instance)
+                loaded_plugins[plugin_name] = plugin_instance
                 log("Plugin loaded", tag=plugin_name)
         except Exception as e:
             log(f"Error while loading plugin: {e}", tag=plugin_name)
-    return loaded_plugins
\ No newline at end of file
+    return loaded_plugins
+
+def stop_plugins(loaded_plugins: dict):
+    """Call the optional stop() method of every plugin, e.g. to save its state before exiting."""
+    for plugin_name, plugin_instance in loaded_plugins.items():
+        stop = getattr(plugin_instance, "stop", None)
+        if stop is None:
+            continue
+        try:
+            stop()
+        except Exception as e:
+            log(f"Error while stopping plugin: {e}", tag=plugin_name)
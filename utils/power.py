@@ -0,0 +1,111 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Power mode: save wakeups while running on battery.
+
+The battery plugin sets the mode from the line power state. On battery,
+timers started with timeout_add_seconds() run `factor` times less often,
+low priority pollers are paused and SVG icons are not rasterized (see
+utils/icon_loader.py). The wakeups caused by the notifier (handled events
+and timers) are counted per mode and reported as wakeups per minute.
+"""
+
+import time
+from gi.repository import GLib
+
+from utils.helper import log
+
+AC = "ac"
+BATTERY = "battery"
+# timer intervals are multiplied by this factor on battery
+BATTERY_FACTOR = 4
+
+_mode = AC
+_factor = BATTERY_FACTOR
+_listeners = []
+# mode -> number of wakeups and seconds spent in it
+_wakeups = {AC: 0, BATTERY: 0}
+_durations = {AC: 0.0, BATTERY: 0.0}
+_mode_since = time.monotonic()
+
+
+def configure(factor: float):
+    """Set the factor timer intervals are multiplied with on battery (1 disables it)."""
+    global _factor
+    _factor = max(1.0, factor)
+
+def get_mode():
+    return _mode
+
+def on_battery():
+    return _mode == BATTERY
+
+def add_listener(callback):
+    """Call callback(mode) when the power mode changes."""
+    _listeners.append(callback)
+
+def set_on_battery(battery: bool):
+    """Switch the power mode, called by the battery plugin."""
+    global _mode, _mode_since
+    mode = BATTERY if battery else AC
+    if mode == _mode:
+        return
+    now = time.monotonic()
+    _durations[_mode] += now - _mode_since
+    _mode_since = now
+    report()
+    _mode = mode
+    log(f"Power mode: {_mode}", tag="power")
+    for callback in list(_listeners):
+        try:
+            callback(_mode)
+        except Exception as e:
+            log(f"Error in power mode listener: {e}", tag="power")
+
+
+def scale(seconds: int):
+    """Return the interval to use for a timer of seconds in the current mode."""
+    if _mode == BATTERY:
+        return max(1, round(seconds * _factor))
+    return seconds
+
+def timeout_add_seconds(seconds: int, callback, *args):
+    """Like GLib.timeout_add_seconds() but the interval is scaled on battery
+    and the wakeups are counted. The interval of a repeating timer is fixed
+    when it is added."""
+    return GLib.timeout_add_seconds(scale(seconds), _on_timer, callback, args)
+
+def _on_timer(callback, args):
+    wakeup()
+    return callback(*args)
+
+
+def wakeup():
+    """Count a wakeup of the main loop caused by the notifier."""
+    _wakeups[_mode] += 1
+
+def wakeup_stats():
+    """Return mode -> (wakeups, minutes spent in the mode)."""
+    durations = dict(_durations)
+    durations[_mode] += time.monotonic() - _mode_since
+    return {mode: (_wakeups[mode], durations[mode] / 60) for mode in (AC, BATTERY)}
+
+def report():
+    """Log the wakeups per minute of both modes."""
+    # rates over less than a second are meaningless
+    stats = [(mode, wakeups, minutes) for mode, (wakeups, minutes) in wakeup_stats().items() if minutes * 60 >= 1]
+    if stats:
+        log("Wakeups per minute: " + ", ".join(f"{mode}: {wakeups / minutes:.1f} ({wakeups} in {minutes:.1f} min)"
+                                               for mode, wakeups, minutes in stats), tag="power")
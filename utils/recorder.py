@@ -0,0 +1,220 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Record the events delivered to plugins and replay them later.
+
+A trace is a JSONL file. The first line is a header, every following line
+describes one call of a plugin handler:
+
+    {"t": 1.234, "plugin": "battery", "handler": "handle_battery_change", "args": [...]}
+
+`t` is the number of seconds since the recording was started.
+
+The results of the blocking calls the plugins offload (pactl, D-Bus property
+reads, sysfs reads, see utils/offload.py) are recorded as well:
+
+    {"t": 1.240, "plugin": "volume_pactl", "offload": "read_volume", "result": [...]}
+
+While a trace is replayed, these calls are not run but answered with the
+recorded results, and live events of the plugins' own subscriptions are
+ignored. Plugins still connect to their services when they are loaded (and
+e.g. volume_pactl still starts `pactl subscribe`), only the events and data
+come from the trace.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from gi.repository import GLib
+
+from utils.helper import log
+from utils.async_loop import call_handler
+
+TRACE_FORMAT = "system-notifier-trace"
+TRACE_VERSION = 2
+
+
+class ReplayError(Exception):
+    """An offloaded call failed while it was recorded, or its result is not in the trace."""
+
+
+class Recorder:
+    """Writes every handler call to a trace file while recording is enabled."""
+    def __init__(self):
+        self.file = None
+        self.start_time = 0.0
+        self.count = 0
+        # set while a trace is replayed: (plugin, call) -> recorded results
+        self.replaying = False
+        self.results = {}
+
+    def open(self, path: str):
+        """Start recording to the given file."""
+        self.file = open(path, "w", buffering=1, encoding="utf-8")
+        self.start_time = time.monotonic()
+        self.count = 0
+        header = {"format": TRACE_FORMAT, "version": TRACE_VERSION, "time": time.time()}
+        self.file.write(json.dumps(header) + "\n")
+        log(f"Recording events to: {path}")
+
+    def close(self):
+        """Stop recording."""
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        log(f"Recorded {self.count} events")
+
+    def record(self, plugin: str, handler: str, args: tuple):
+        """Append one handler call to the trace."""
+        if self.file is None:
+            return
+        self._write({
+            "t": round(time.monotonic() - self.start_time, 6),
+            "plugin": plugin,
+            "handler": handler,
+            "args": args,
+        })
+
+    def record_result(self, plugin: str, call: str, result=None, error: Exception = None):
+        """Append the result (or error) of an offloaded call to the trace."""
+        if self.file is None:
+            return
+        event = {"t": round(time.monotonic() - self.start_time, 6), "plugin": plugin, "offload": call}
+        if error is not None:
+            event["error"] = str(error)
+        else:
+            event["result"] = result
+        self._write(event)
+
+    def start_replay(self, path: str):
+        """Answer offloaded calls with the results recorded in path from now on."""
+        self.replaying = True
+        self.results = {}
+        for event in read_trace(path):
+            if "offload" in event:
+                self.results.setdefault((event["plugin"], event["offload"]), deque()).append(event)
+
+    def replay_result(self, plugin: str, call: str):
+        """Return the next recorded result of an offloaded call, raise its error."""
+        results = self.results.get((plugin, call))
+        if not results:
+            raise ReplayError(f"no recorded result for {call}")
+        event = results.popleft()
+        if "error" in event:
+            raise ReplayError(event["error"])
+        return event["result"]
+
+    def _write(self, event: dict):
+        try:
+            self.file.write(json.dumps(event, default=str) + "\n")
+            self.count += 1
+        except (OSError, TypeError, ValueError) as e:
+            log(f"Cannot record event: {e}")
+
+
+# the recorder shared by all plugin contexts
+recorder = Recorder()
+
+
+def read_trace(path: str):
+    """Yield the events of a trace file in order."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if "plugin" in event:
+                yield event
+
+
+def replay(path: str, plugins: dict, speed: float = 1.0, on_finished=None):
+    """Re-inject the events of a trace into the loaded plugins.
+
+    The events are scheduled on the GLib main loop one after another. With a
+    speed of 2 the trace is replayed twice as fast, a speed of 0 delivers all
+    events without any delay. When the trace is exhausted a summary with the
+    time spent in each handler is logged and on_finished is called.
+    """
+    events = (event for event in read_trace(path) if "handler" in event)
+    start_time = time.monotonic()
+    stats = {}
+    # async handlers that have not finished yet
+    running = set()
+    exhausted = False
+
+    def finish():
+        _log_summary(stats, time.monotonic() - start_time)
+        if on_finished:
+            on_finished()
+
+    def count(key, t0):
+        calls, total = stats.get(key, (0, 0.0))
+        stats[key] = (calls + 1, total + time.perf_counter() - t0)
+
+    def task_done(task, key, t0):
+        running.discard(task)
+        count(key, t0)
+        if exhausted and not running:
+            finish()
+
+    def schedule_next():
+        nonlocal exhausted
+        event = next(events, None)
+        if event is None:
+            exhausted = True
+            # wait for the async handlers, their time is part of the summary
+            if not running:
+                finish()
+            return
+        delay = 0
+        if speed > 0:
+            delay = max(0.0, start_time + event["t"] / speed - time.monotonic())
+        GLib.timeout_add(int(delay * 1000), deliver, event)
+
+    def deliver(event):
+        plugin = plugins.get(event["plugin"])
+        handler = getattr(plugin, event["handler"], None) if plugin else None
+        if handler is None:
+            log(f"Cannot replay event for {event['plugin']}.{event['handler']}")
+        else:
+            key = f"{event['plugin']}.{event['handler']}"
+            t0 = time.perf_counter()
+            result = None
+            try:
+                result = call_handler(handler, event["args"], tag=event["plugin"])
+            except Exception as e:
+                log(f"Error while replaying event: {e}", tag=event["plugin"])
+            if isinstance(result, asyncio.Task):
+                # count the time until the task has finished, not its creation
+                running.add(result)
+                result.add_done_callback(lambda task, key=key, t0=t0: task_done(task, key, t0))
+            else:
+                count(key, t0)
+        schedule_next()
+        return GLib.SOURCE_REMOVE
+
+    log(f"Replaying events from: {path} (speed {speed})")
+    schedule_next()
+
+
+def _log_summary(stats: dict, elapsed: float):
+    total = sum(count for count, _ in stats.values())
+    log(f"Replayed {total} events in {elapsed:.3f}s")
+    for key, (count, handler_time) in sorted(stats.items(), key=lambda i: -i[1][1]):
+        log(f"  {key}: {count} calls, {handler_time * 1000:.2f}ms total, "
+            f"{handler_time * 1000 / count:.3f}ms avg")
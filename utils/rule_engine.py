@@ -0,0 +1,298 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compile declarative notification rules into dispatch tables.
+
+A rule is a config section named `rule:<name>`:
+
+    [rule:lid]
+    bus = system
+    sender = org.freedesktop.login1
+    path = /org/freedesktop/login1
+    interface = org.freedesktop.login1.Manager
+    property = LidClosed
+    condition = == true
+    summary = Lid closed
+    icon = computer
+
+`path` may end with `*` to match all objects below a prefix. `condition` is
+an operator (==, !=, <, <=, >, >=) followed by a literal. `summary` and
+`body` are templates with the fields {value}, {property}, {path},
+{interface} and {name} (the last component of the object path), format
+specs like {value:.0f} may be used.
+
+Instead of a single `icon`, `icons` maps values to icons. If all keys are
+numbers they are thresholds (the highest threshold <= value wins), e.g.
+`icons = 75: audio-volume-high, 35: audio-volume-medium, 0: audio-volume-low`,
+otherwise the value is looked up directly (`icons = true: a, false: b`).
+"""
+
+import operator
+import re
+import string
+from bisect import bisect_right
+
+RULE_SECTION_PREFIX = "rule:"
+TEMPLATE_FIELDS = ("value", "property", "path", "interface", "name")
+
+CONDITION_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+
+class RuleError(ValueError):
+    """Raised for invalid rule definitions."""
+
+
+class Rule:
+    """A compiled rule. Everything that can be computed ahead is computed here."""
+    def __init__(self, name: str, section, resolve_icon):
+        self.name = name
+        self.bus = section.get("bus", "system").strip()
+        if self.bus not in ("system", "session"):
+            raise RuleError(f"{name}: bus must be 'system' or 'session'")
+        self.sender = _required(section, name, "sender")
+        self.path = _required(section, name, "path")
+        self.interface = _required(section, name, "interface")
+        self.property = _required(section, name, "property")
+        self.condition = _compile_condition(name, section.get("condition", ""))
+        self.summary = section.get("summary", "{property}: {value}")
+        self.body = section.get("body", "")
+        self.urgency = section.get("urgency", "normal").strip()
+        if self.urgency not in ("low", "normal", "critical"):
+            raise RuleError(f"{name}: invalid urgency '{self.urgency}'")
+        self.timeout = section.getint("timeout", fallback=None)
+        self.progress = section.getboolean("progress", fallback=False)
+        self.replace_id = section.get("replace_id", RULE_SECTION_PREFIX + name)
+        self.icon, self.icon_thresholds, self.icon_levels, self.icon_map = \
+            _compile_icons(name, section, resolve_icon)
+        # check the templates once instead of failing on every signal
+        for template in (self.summary, self.body):
+            _check_template(name, template)
+
+    @property
+    def is_prefix(self):
+        return self.path.endswith("*")
+
+    def get_icon(self, value):
+        """Return the icon for value."""
+        if self.icon_thresholds:
+            try:
+                i = bisect_right(self.icon_thresholds, float(value)) - 1
+            except (TypeError, ValueError):
+                return self.icon
+            return self.icon_levels[i] if i >= 0 else self.icon
+        if self.icon_map:
+            return self.icon_map.get(_normalize_key(value), self.icon)
+        return self.icon
+
+    def render(self, value, path: str):
+        """Return the keyword arguments for PluginContext.notify()."""
+        fields = {
+            "value": value,
+            "property": self.property,
+            "path": path,
+            "interface": self.interface,
+            "name": path.rsplit("/", 1)[-1],
+        }
+        kwargs = {
+            "summary": self.summary.format(**fields),
+            "body": self.body.format(**fields),
+            "icon": self.get_icon(value),
+            "urgency": self.urgency,
+            "timeout": self.timeout,
+            "replace_id": self.replace_id,
+        }
+        if self.progress:
+            try:
+                kwargs["progress"] = max(0, min(100, int(value)))
+            except (TypeError, ValueError):
+                pass
+        return kwargs
+
+
+class DispatchTable:
+    """Rules of one (bus, sender) subscription, indexed for O(1) lookups.
+
+    exact:  (path, interface) -> {property: [rules]}
+    prefix: interface -> [(path prefix, {property: [rules]})]
+    """
+    def __init__(self, bus: str, sender: str):
+        self.bus = bus
+        self.sender = sender
+        self.exact = {}
+        self.prefix = {}
+        self.count = 0
+
+    def add(self, rule: Rule):
+        self.count += 1
+        if rule.is_prefix:
+            entries = self.prefix.setdefault(rule.interface, [])
+            prefix = rule.path[:-1]
+            for entry_prefix, properties in entries:
+                if entry_prefix == prefix:
+                    break
+            else:
+                properties = {}
+                entries.append((prefix, properties))
+        else:
+            properties = self.exact.setdefault((rule.path, rule.interface), {})
+        properties.setdefault(rule.property, []).append(rule)
+
+    @property
+    def paths(self):
+        """All exact object paths (None if prefix rules exist)."""
+        if self.prefix:
+            return None
+        return {path for path, _ in self.exact}
+
+    @property
+    def interfaces(self):
+        return {interface for _, interface in self.exact} | set(self.prefix)
+
+    def match(self, path: str, interface: str, changed_properties: dict):
+        """Yield (rule, value) for every rule matching a PropertiesChanged signal."""
+        tables = []
+        properties = self.exact.get((path, interface))
+        if properties:
+            tables.append(properties)
+        for prefix, properties in self.prefix.get(interface, ()):
+            if path.startswith(prefix):
+                tables.append(properties)
+        for properties in tables:
+            # iterate over the smaller of both dicts
+            if len(changed_properties) < len(properties):
+                candidates = ((p, properties.get(p)) for p in changed_properties)
+            else:
+                candidates = ((p, rules) for p, rules in properties.items() if p in changed_properties)
+            for prop, rules in candidates:
+                if not rules:
+                    continue
+                value = changed_properties[prop]
+                for rule in rules:
+                    if rule.condition(value):
+                        yield rule, value
+
+
+def compile_rules(config, resolve_icon):
+    """
+    Compile all rule sections of config into dispatch tables.
+
+    Returns a dict (bus, sender) -> DispatchTable and a list of errors for
+    rules that could not be compiled.
+    """
+    tables = {}
+    errors = []
+    for section_name in config.sections():
+        if not section_name.startswith(RULE_SECTION_PREFIX):
+            continue
+        name = section_name[len(RULE_SECTION_PREFIX):]
+        try:
+            rule = Rule(name, config[section_name], resolve_icon)
+        except (RuleError, ValueError) as e:
+            errors.append(str(e))
+            continue
+        key = (rule.bus, rule.sender)
+        if key not in tables:
+            tables[key] = DispatchTable(rule.bus, rule.sender)
+        tables[key].add(rule)
+    return tables, errors
+
+
+def _required(section, rule_name, option):
+    value = section.get(option, "").strip()
+    if not value:
+        raise RuleError(f"{rule_name}: option '{option}' is missing")
+    return value
+
+def _check_template(rule_name: str, template: str):
+    """Check the field names of a template. Format specs like {value:.0f} depend
+    on the type of the value, so they are not checked."""
+    try:
+        fields = [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+    except ValueError as e:
+        raise RuleError(f"{rule_name}: invalid template '{template}': {e}") from None
+    for field in fields:
+        # {path.attr} and {value[0]} refer to the field before the attribute or index
+        if re.split(r"[.\[]", field, maxsplit=1)[0] not in TEMPLATE_FIELDS:
+            raise RuleError(f"{rule_name}: unknown field '{{{field}}}' in template '{template}'")
+
+def _parse_literal(text: str):
+    text = text.strip()
+    lowered = text.lower()
+    if lowered in ("true", "yes", "on"):
+        return True
+    if lowered in ("false", "no", "off"):
+        return False
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    return text
+
+def _normalize_key(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+def _compile_condition(rule_name: str, condition: str):
+    condition = condition.strip()
+    if not condition:
+        return lambda value: True
+    # two character operators have to be checked first
+    for symbol in sorted(CONDITION_OPERATORS, key=len, reverse=True):
+        if condition.startswith(symbol):
+            op = CONDITION_OPERATORS[symbol]
+            literal = _parse_literal(condition[len(symbol):])
+            def check(value, op=op, literal=literal):
+                try:
+                    return op(value, literal)
+                except TypeError:
+                    return False
+            return check
+    raise RuleError(f"{rule_name}: invalid condition '{condition}'")
+
+def _compile_icons(rule_name: str, section, resolve_icon):
+    icon = section.get("icon", "").strip()
+    icon = resolve_icon(icon) if icon else ""
+    thresholds, levels, icon_map = [], [], {}
+    spec = section.get("icons", "").strip()
+    if not spec:
+        return icon, thresholds, levels, icon_map
+
+    entries = []
+    for item in spec.split(","):
+        key, sep, name = item.partition(":")
+        if not sep or not name.strip():
+            raise RuleError(f"{rule_name}: invalid icons entry '{item.strip()}'")
+        entries.append((_parse_literal(key), resolve_icon(name.strip())))
+
+    if all(isinstance(k, (int, float)) and not isinstance(k, bool) for k, _ in entries):
+        entries.sort(key=lambda e: e[0])
+        thresholds = [float(k) for k, _ in entries]
+        levels = [i for _, i in entries]
+    else:
+        icon_map = {_normalize_key(k): i for k, i in entries}
+    return icon, thresholds, levels, icon_map
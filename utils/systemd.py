@@ -0,0 +1,53 @@
+# This file is part of system-notifier.
+#
+# system-notifier is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# system-notifier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with system-notifier.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The parts of the systemd service protocol we need, without libsystemd."""
+
+import os
+import socket
+
+# first file descriptor passed by socket activation
+LISTEN_FDS_START = 3
+
+
+def sd_notify(state: str):
+    """Send a state (e.g. 'READY=1') to the service manager, if there is one."""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # abstract socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto(state.encode(), address)
+        return True
+    except OSError:
+        return False
+
+def listen_fds():
+    """Return the file descriptors passed by socket activation."""
+    try:
+        if int(os.environ.get("LISTEN_PID", 0)) != os.getpid():
+            return []
+        count = int(os.environ.get("LISTEN_FDS", 0))
+    except ValueError:
+        return []
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+    fds = list(range(LISTEN_FDS_START, LISTEN_FDS_START + count))
+    for fd in fds:
+        os.set_inheritable(fd, False)
+    return fds